@@ -0,0 +1,92 @@
+import functools
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+
+# Заголовки запроса, от которых зависит ответ.
+VARY_HEADERS = ['HTTP_ACCEPT', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE']
+
+
+def get_flight_key(view, request, per_user):
+    parts = [
+        type(view).__name__, view.action, request.get_full_path(),
+        *[request.META.get(header, '') for header in VARY_HEADERS]
+    ]
+    if per_user:
+        parts.append(request.user.pk)
+    return 'single-flight:' + hashlib.md5(
+        ':'.join(map(str, parts)).encode()
+    ).hexdigest()
+
+
+def wait_for_result(key, token):
+    """
+    Ожидание ответа ведущего запроса не дольше SINGLE_FLIGHT_MAX_WAIT:
+    ожидание занимает воркер. None, если ответ не дождались.
+    """
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_MAX_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+        result = cache.get(f'{key}:{token}')
+        if result is not None:
+            return result
+        if cache.get(key) != token:
+            return cache.get(f'{key}:{token}')
+    return None
+
+
+def single_flight(per_user=True):
+    """
+    Одинаковые параллельные запросы выполняются один раз. Первый
+    запрос занимает ключ в кеше и считает ответ, остальные ждут его
+    и получают копию. Запрос, пришедший после завершения ведущего,
+    считает ответ заново, поэтому устаревшие данные не отдаются.
+    Ответ DRF сохраняется после отрисовки, которую выполняет Django
+    после finalize_response во view.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            key = get_flight_key(self, request, per_user)
+            token = uuid.uuid4().hex
+            if not cache.add(key, token, settings.SINGLE_FLIGHT_TIMEOUT):
+                leader = cache.get(key)
+                result = leader and wait_for_result(key, leader)
+                if result is not None:
+                    status_code, headers, content = result
+                    return HttpResponse(
+                        content, status=status_code, headers=headers
+                    )
+
+            def release(response=None):
+                if response is not None and not response.streaming:
+                    cache.set(
+                        f'{key}:{token}',
+                        (
+                            response.status_code, dict(response.headers),
+                            response.content
+                        ),
+                        settings.SINGLE_FLIGHT_TIMEOUT
+                    )
+                if cache.get(key) == token:
+                    cache.delete(key)
+
+            try:
+                response = handler(self, request, *args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            if isinstance(response, SimpleTemplateResponse) and (
+                not response.is_rendered
+            ):
+                response.add_post_render_callback(release)
+            else:
+                release(response)
+            return response
+        return wrapper
+    return decorator
@@ -1,15 +1,18 @@
 from django_filters import rest_framework
 
-from recipes.models import Recipe, Tag, User
+from recipes.models import Favorite, Recipe, ShoppingCart, User
+from recipes.tag_registry import tag_registry
 
 
 class RecipeFilter(rest_framework.FilterSet):
-    tags = rest_framework.ModelMultipleChoiceFilter(
-        field_name='tags__slug', to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = rest_framework.MultipleChoiceFilter(
+        choices=lambda: [(slug, slug) for slug in tag_registry.get_slugs()],
+        method='filter_tags'
+    )
+    is_favorited = rest_framework.BooleanFilter(method='filter_recipe_ids')
+    is_in_shopping_cart = rest_framework.BooleanFilter(
+        method='filter_recipe_ids'
     )
-    is_favorited = rest_framework.BooleanFilter()
-    is_in_shopping_cart = rest_framework.BooleanFilter()
     author = rest_framework.ModelChoiceFilter(
         queryset=User.objects.all(), to_field_name='id',
         field_name='author'
@@ -19,6 +22,28 @@ class RecipeFilter(rest_framework.FilterSet):
         model = Recipe
         fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
 
+    def filter_tags(self, queryset, name, value):
+        """Рецепты с любым из тегов, slug переводятся в id по реестру."""
+        if not value:
+            return queryset
+        tag_ids = [tag_registry.get_id_by_slug(slug) for slug in value]
+        return queryset.filter(
+            id__in=Recipe.tags.through.objects.filter(
+                tag_id__in=tag_ids
+            ).values('recipe_id')
+        )
+
+    def filter_recipe_ids(self, queryset, name, value):
+        """Фильтр по id рецептов из кеша избранного или корзины."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        model = Favorite if name == 'is_favorited' else ShoppingCart
+        recipe_ids = model.objects.recipe_ids(user)
+        if value:
+            return queryset.filter(id__in=recipe_ids)
+        return queryset.exclude(id__in=recipe_ids)
+
 
 class IngredientFilter(rest_framework.FilterSet):
     def filter_queryset(self, queryset):
@@ -26,3 +51,12 @@ class IngredientFilter(rest_framework.FilterSet):
         if name is not None:
             queryset = queryset.filter(name__startswith=name)
         return queryset
+
+
+class UserFilter(rest_framework.FilterSet):
+    username = rest_framework.CharFilter(lookup_expr='startswith')
+    email = rest_framework.CharFilter(lookup_expr='startswith')
+
+    class Meta:
+        model = User
+        fields = ['username', 'email']
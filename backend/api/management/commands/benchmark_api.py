@@ -0,0 +1,91 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.renderers import FastJSONRenderer
+from foodgram.compression import ENCODERS
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить время обработки GET-запроса к API и долю, '
+        'которую занимает отрисовка JSON, и затраты на сжатие ответа.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/recipes/')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--host', default=settings.ALLOWED_HOSTS[0])
+        parser.add_argument(
+            '--user', type=int, help='id пользователя для авторизации.'
+        )
+
+    def get_response(self, path, host, user):
+        request = APIRequestFactory().get(path, HTTP_HOST=host)
+        if user is not None:
+            force_authenticate(request, user=user)
+        match = resolve(request.path_info)
+        return match.func(request, *match.args, **match.kwargs)
+
+    def write_compression(self, content, iterations):
+        """Размер сжатого ответа и процессорное время на сжатие."""
+        for encoder in ENCODERS:
+            start = time.process_time()
+            for _ in range(iterations):
+                compressed = encoder.compress(content)
+            total = time.process_time() - start
+            self.stdout.write(
+                f'{encoder.name}: {len(compressed)} байт '
+                f'({len(compressed) / len(content):.1%}), '
+                f'{total / iterations * 1000:.3f} мс процессора'
+            )
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(id=options['user']).first()
+            if user is None:
+                raise CommandError('Пользователь не найден.')
+        iterations = options['iterations']
+        view_time = 0
+        render_time = {JSONRenderer: 0, FastJSONRenderer: 0}
+        output = {}
+        for _ in range(iterations):
+            start = time.perf_counter()
+            response = self.get_response(
+                options['path'], options['host'], user
+            )
+            view_time += time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f'Ответ {response.status_code}.')
+            for renderer_class in render_time:
+                renderer = renderer_class()
+                start = time.perf_counter()
+                output[renderer_class] = renderer.render(
+                    response.data, renderer.media_type
+                )
+                render_time[renderer_class] += time.perf_counter() - start
+        self.stdout.write(
+            f'{options["path"]}: {iterations} запросов, '
+            f'{len(output[JSONRenderer])} байт в ответе'
+        )
+        self.stdout.write(
+            f'Обработка без отрисовки: {view_time / iterations * 1000:.2f} мс'
+        )
+        for renderer_class, total in render_time.items():
+            self.stdout.write(
+                f'{renderer_class.__name__}: '
+                f'{total / iterations * 1000:.3f} мс, '
+                f'{total / (view_time + total):.1%} времени запроса'
+            )
+        if len(output[FastJSONRenderer]) < settings.COMPRESSION_MIN_SIZE:
+            self.stdout.write('Ответ меньше порога сжатия.')
+        self.write_compression(output[FastJSONRenderer], iterations)
+        if output[JSONRenderer] != output[FastJSONRenderer]:
+            raise CommandError('Вывод рендереров различается.')
+        self.stdout.write(self.style.SUCCESS('Вывод рендереров совпадает.'))
@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import (
+    RecipeFastReadSerializer, RecipeReadSerializer, set_recipe_flags,
+    set_recipe_tag_ids
+)
+from api.views import RecipeViewSet
+from recipes.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнить вывод и скорость RecipeReadSerializer и '
+        'RecipeFastReadSerializer на странице рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument(
+            '--limit', type=int, default=settings.REST_FRAMEWORK['PAGE_SIZE']
+        )
+        parser.add_argument('--host', default=settings.ALLOWED_HOSTS[0])
+        parser.add_argument(
+            '--user', type=int, help='id пользователя для авторизации.'
+        )
+
+    def handle(self, *args, **options):
+        request = Request(
+            APIRequestFactory().get('/api/recipes/', HTTP_HOST=options['host'])
+        )
+        request.user = AnonymousUser()
+        if options['user']:
+            request.user = User.objects.filter(id=options['user']).first()
+            if request.user is None:
+                raise CommandError('Пользователь не найден.')
+        view = RecipeViewSet(
+            request=request, action='list', format_kwarg=None, kwargs={}
+        )
+        recipes = list(view.get_queryset()[:options['limit']])
+        if not recipes:
+            raise CommandError('Нет рецептов для сравнения.')
+        set_recipe_tag_ids(recipes)
+        if request.user.is_authenticated:
+            set_recipe_flags(recipes, request.user)
+        context = {'request': request}
+        results = {}
+        for serializer_class in (RecipeReadSerializer,
+                                 RecipeFastReadSerializer):
+            start = time.perf_counter()
+            for _ in range(options['iterations']):
+                data = serializer_class(
+                    recipes, many=True, context=context
+                ).data
+            elapsed = time.perf_counter() - start
+            results[serializer_class] = (data, elapsed)
+            self.stdout.write(
+                f'{serializer_class.__name__}: '
+                f'{elapsed / options["iterations"] * 1000:.3f} мс '
+                f'на {len(recipes)} рецептов'
+            )
+        (expected, slow), (actual, fast) = results.values()
+        if expected != actual:
+            raise CommandError('Вывод сериализаторов различается.')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Вывод совпадает, ускорение в {slow / fast:.1f} раза.'
+            )
+        )
@@ -0,0 +1,131 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Загрузка процесса воркера: приложение WSGI и URLconf со всеми
+# вьюсетами, которые Django иначе импортирует при первом запросе.
+STARTUP_CODE = '''
+import resource, time
+start = time.perf_counter()
+import foodgram.wsgi
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - start)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+# Модель воркеров gunicorn: приложение загружается до fork (preload)
+# или в каждом воркере. Воркер сообщает свою частную память
+# из /proc/self/smaps_rollup после сборки мусора, которую в работе
+# всё равно выполнит gc.
+WORKERS_CODE = '''
+import gc, os, statistics, sys, time
+
+
+def load():
+    import foodgram.wsgi
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+
+
+preload, workers = sys.argv[1] == '1', int(sys.argv[2])
+start = time.perf_counter()
+if preload:
+    load()
+    gc.freeze()
+reader, writer = os.pipe()
+pids = []
+for _ in range(workers):
+    pid = os.fork()
+    if pid == 0:
+        if not preload:
+            load()
+        gc.collect()
+        with open('/proc/self/smaps_rollup') as file:
+            private = sum(
+                int(line.split()[1]) for line in file
+                if line.startswith(('Private_Clean', 'Private_Dirty'))
+            )
+        os.write(writer, f'{private}\\n'.encode())
+        os._exit(0)
+    pids.append(pid)
+for pid in pids:
+    os.waitpid(pid, 0)
+os.close(writer)
+print(time.perf_counter() - start)
+print(statistics.median(map(int, os.read(reader, 65536).split())))
+'''
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить запуск процесса через python -X importtime: время '
+        'загрузки, пиковую память и вклад пакетов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help=(
+                'Сравнить загрузку N воркеров с preload и без него '
+                '(только Linux).'
+            )
+        )
+
+    def run_python(self, *args):
+        env = {
+            **os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE
+        }
+        result = subprocess.run(
+            [sys.executable, *args],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr)
+        return result
+
+    def run_once(self):
+        result = self.run_python('-X', 'importtime', '-c', STARTUP_CODE)
+        seconds, max_rss = result.stdout.split()
+        packages = Counter()
+        for match in IMPORT_TIME_LINE.finditer(result.stderr):
+            packages[match[2].split('.')[0]] += int(match[1])
+        return float(seconds), int(max_rss), packages
+
+    def handle(self, *args, **options):
+        runs = [self.run_once() for _ in range(options['repeat'])]
+        seconds = statistics.median(run[0] for run in runs)
+        max_rss = statistics.median(run[1] for run in runs)
+        packages = Counter()
+        for _, _, run_packages in runs:
+            packages.update(run_packages)
+        self.stdout.write(
+            f'Запуск: {seconds * 1000:.0f} мс (медиана {len(runs)}), '
+            f'пиковая память {max_rss / 1024:.1f} МБ'
+        )
+        self.stdout.write('Собственное время импорта по пакетам:')
+        for package, microseconds in packages.most_common(options['top']):
+            self.stdout.write(
+                f'{package:30} {microseconds / len(runs) / 1000:8.1f} мс'
+            )
+
+        if options['workers']:
+            for preload in (False, True):
+                seconds, private = self.run_python(
+                    '-c', WORKERS_CODE, str(int(preload)),
+                    str(options['workers'])
+                ).stdout.split()
+                self.stdout.write(
+                    f'{options["workers"]} воркеров, '
+                    f'{"с preload" if preload else "без preload"}: '
+                    f'{float(seconds) * 1000:.0f} мс, частная память '
+                    f'воркера {float(private) / 1024:.1f} МБ'
+                )
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram.profiling import clear_stacks, export_profile, read_stacks
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузить стеки выборочного профилировщика запросов в формате '
+        'collapsed (flamegraph.pl, speedscope) или speedscope.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', choices=['collapsed', 'speedscope'],
+            default='collapsed'
+        )
+        parser.add_argument(
+            '--route', help='Имя маршрута, например recipes-list.'
+        )
+        parser.add_argument(
+            '--output', help='Файл для профиля; по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить накопленные стеки после выгрузки.'
+        )
+
+    def handle(self, *args, **options):
+        stacks = read_stacks(options['route'])
+        if not stacks:
+            raise CommandError('Стеков нет: профилирование не включено?')
+        content, _ = export_profile(
+            stacks, options['format'], options['route'] or 'foodgram'
+        )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(content)
+            self.stderr.write(
+                f'Сэмплов: {sum(stacks.values())}, '
+                f'стеков: {len(stacks)} -> {options["output"]}'
+            )
+        else:
+            self.stdout.write(content, ending='')
+        if options['clear']:
+            clear_stacks()
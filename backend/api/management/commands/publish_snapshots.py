@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.snapshots import publish_snapshots, read_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        'Перезаписать статические снимки ответов API для анонимных '
+        'пользователей или показать их свежесть.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', action='store_true',
+            help='Только показать возраст и стоимость последней публикации.'
+        )
+
+    def write_manifest(self, manifest):
+        age = timezone.now() - parse_datetime(manifest['generated_at'])
+        self.stdout.write(
+            f'Опубликовано {manifest["generated_at"]} '
+            f'({age.total_seconds():.0f} с назад)'
+        )
+        self.stdout.write(
+            f'Файлов: {len(manifest["files"])}, '
+            f'{sum(manifest["files"].values())} байт; '
+            f'генерация {manifest["duration"] * 1000:.0f} мс, '
+            f'процессор {manifest["cpu_time"] * 1000:.0f} мс'
+        )
+
+    def handle(self, *args, **options):
+        if options['status']:
+            manifest = read_manifest()
+            if manifest is None:
+                raise CommandError('Снимки ещё не публиковались.')
+            self.write_manifest(manifest)
+            return
+        if not settings.SNAPSHOT_HOSTS:
+            raise CommandError('Не задан SNAPSHOT_HOSTS.')
+        self.write_manifest(publish_snapshots())
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогреть соединения с базами, реестр тегов, справочник '
+        'ингредиентов и горячие страницы рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=settings.WARMUP_HOST)
+
+    def handle(self, *args, **options):
+        timings = warm_up(options['host'])
+        for name, seconds in timings.items():
+            self.stdout.write(f'{name}: {seconds * 1000:.1f} мс')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Прогрев завершён за {sum(timings.values()) * 1000:.1f} мс'
+            )
+        )
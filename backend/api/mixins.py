@@ -0,0 +1,152 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db_router import (
+    PRIMARY_DATABASE, read_database, use_primary, use_replica
+)
+
+
+class ReplicaRoutingMixin:
+    """
+    Безопасные запросы читают из реплики. После успешной записи
+    пользователь на REPLICA_PIN_SECONDS закрепляется за основной базой,
+    чтобы сразу видеть свои изменения. Действия из replica_read_actions
+    только читают данные при любом методе запроса.
+    """
+    replica_read_actions = []
+
+    def is_read_request(self, request):
+        return (
+            request.method in SAFE_METHODS
+            or getattr(self, 'action', None) in self.replica_read_actions
+        )
+
+    @staticmethod
+    def get_pin_key(user):
+        return f'replica-pin:{user.id}'
+
+    def dispatch(self, request, *args, **kwargs):
+        token = read_database.set(PRIMARY_DATABASE)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            read_database.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not self.is_read_request(request):
+            use_primary()
+        elif not (
+            request.user.is_authenticated
+            and cache.get(self.get_pin_key(request.user))
+        ):
+            use_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            not self.is_read_request(request)
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            cache.set(
+                self.get_pin_key(request.user), True,
+                settings.REPLICA_PIN_SECONDS
+            )
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def make_etag(*parts):
+    """Непрозрачный ETag из значений, от которых зависит ответ."""
+    return quote_etag(
+        hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    )
+
+
+class ConditionalGetMixin:
+    """
+    Поддержка ETag и Last-Modified для list и retrieve. Валидаторы
+    вычисляются лёгким запросом к полям validator_fields, и при
+    совпадении ответ 304 отдаётся без выборки и сериализации данных.
+    Список отдаёт только ETag: удаление строки не меняет максимум
+    updated_at, и If-Modified-Since вернул бы 304 с удалённой строкой.
+    """
+    validator_fields = ['updated_at']
+
+    def get_etag_parts(self):
+        """Дополнительные значения, от которых зависит ответ."""
+        return []
+
+    def get_validators(self):
+        """Возвращает пару (etag, last_modified) или None."""
+        if self.action == 'list':
+            state = self.filter_queryset(self.get_queryset()).aggregate(
+                count=Count('id'), **{
+                    field: Max(field) for field in self.validator_fields
+                }
+            )
+            if state['count'] == 0:
+                return None
+            return make_etag(
+                self.request.get_full_path(), state['count'],
+                *(
+                    state[field].timestamp()
+                    for field in self.validator_fields
+                ),
+                *self.get_etag_parts()
+            ), None
+        if self.action == 'retrieve':
+            try:
+                row = self.get_queryset().filter(
+                    pk=self.kwargs[self.lookup_field]
+                ).values_list(*self.validator_fields).first()
+            except (TypeError, ValueError):
+                return None
+            if row is None:
+                return None
+            timestamps = [updated_at.timestamp() for updated_at in row]
+            return (
+                make_etag(
+                    self.request.get_full_path(), *timestamps,
+                    *self.get_etag_parts()
+                ),
+                int(max(timestamps))
+            )
+        return None
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return handler(request, *args, **kwargs)
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if not (
+            200 <= response.status_code < 300
+            or response.status_code == status.HTTP_304_NOT_MODIFIED
+        ):
+            return response
+        if etag is not None:
+            response.headers['ETag'] = etag
+        if last_modified is not None:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
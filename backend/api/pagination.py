@@ -0,0 +1,10 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class FeedCursorPagination(CursorPagination):
+    """Курсор стабилен при появлении новых рецептов в ленте."""
+    ordering = ['-publication_date', '-id']
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'limit'
+    max_page_size = 100
@@ -2,6 +2,7 @@ import base64
 import re
 
 from django.core.files.base import ContentFile
+from django.db import models
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
@@ -9,8 +10,12 @@ from recipes.models import (
     Favorite, Follow, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
     Tag, User
 )
+from recipes.tag_registry import tag_registry
+from recipes.tasks import refresh_shopping_lists
 from recipes.constants import (
-    MIN_AMOUNT, MIN_COOKING_TIME, RECIPES_LIMIT, REGEX_FOR_HEX_COLOR
+    BULK_RECIPES_LIMIT, MAX_SERVINGS, MIN_AMOUNT, MIN_COOKING_TIME,
+    MIN_SERVINGS, RECIPE_EXPANDABLE_FIELDS, RECIPE_FIELDS, RECIPES_LIMIT,
+    REGEX_FOR_HEX_COLOR, SIMILAR_MAX_LIMIT, SIMILAR_RECIPES_LIMIT
 )
 
 
@@ -24,6 +29,20 @@ class ColorField(serializers.CharField):
         return super().to_internal_value(data)
 
 
+class TagPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """Поиск тега по id в реестре тегов вместо запроса к базе."""
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            tag = tag_registry.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
+
+
 class Base64ImageField(serializers.ImageField):
     """Декодирование и сохраниние картинок."""
     def to_internal_value(self, data):
@@ -46,13 +65,13 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['is_subscribed']
 
     def get_is_subscribed(self, obj):
-        return (
-            self.context['request'].user.is_authenticated
-            and self.context['request'].user != obj
-            and self.context['request'].user.follower.filter(
-                author_id=obj.id
-            ).exists()
-        )
+        """Берётся из аннотации is_subscribed, если она есть."""
+        user = self.context['request'].user
+        if not user.is_authenticated or user == obj:
+            return False
+        if hasattr(obj, 'is_subscribed'):
+            return bool(obj.is_subscribed)
+        return user.follower.filter(author_id=obj.id).exists()
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -95,7 +114,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         many=True, source='recipeingredient_set', read_only=True
     )
     image = Base64ImageField(required=False, allow_null=True)
-    tags = TagSerializer(read_only=True, many=True)
+    tags = serializers.SerializerMethodField()
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
@@ -108,14 +127,168 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['is_favorited', 'is_in_shopping_cart', 'tags']
 
+    def get_tags(self, recipe):
+        if not hasattr(recipe, 'tag_ids'):
+            set_recipe_tag_ids([recipe])
+        return TagSerializer(
+            tag_registry.get_ordered(recipe.tag_ids), many=True
+        ).data
+
+
+def set_recipe_tag_ids(recipes):
+    """id тегов рецептов одним запросом к промежуточной таблице."""
+    tag_ids = {recipe.id: [] for recipe in recipes}
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        recipe_id__in=tag_ids
+    ).values_list('recipe_id', 'tag_id'):
+        tag_ids[recipe_id].append(tag_id)
+    for recipe in recipes:
+        recipe.tag_ids = tag_ids[recipe.id]
+
+
+def set_recipe_flags(recipes, user):
+    """Отметки is_favorited и is_in_shopping_cart из кеша пользователя."""
+    favorited_ids = set(Favorite.objects.recipe_ids(user))
+    carted_ids = set(ShoppingCart.objects.recipe_ids(user))
+    for recipe in recipes:
+        recipe.is_favorited = recipe.id in favorited_ids
+        recipe.is_in_shopping_cart = recipe.id in carted_ids
+
+
+class RecipeListFastReadSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, models.manager.BaseManager)
+            else data
+        )
+        self.child.prepare(recipes)
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
+class RecipeFastReadSerializer(serializers.BaseSerializer):
+    """
+    Сериализация рецептов для чтения без полей DRF: словари собираются
+    из объектов с подгруженными author и ингредиентами.
+    По умолчанию вывод совпадает с RecipeReadSerializer. Поля ответа
+    и раскрываемые объекты задаются в контексте ключами fields
+    и expand, нераскрытые author, tags и ingredients выводятся
+    как id.
+    """
+    subscribed_ids = None
+
+    class Meta:
+        list_serializer_class = RecipeListFastReadSerializer
+
+    @property
+    def selected_fields(self):
+        return self.context.get('fields', RECIPE_FIELDS)
+
+    @property
+    def expanded_fields(self):
+        return self.context.get('expand', RECIPE_EXPANDABLE_FIELDS)
+
+    def prepare(self, recipes):
+        """
+        Для выбранных полей подписки на авторов страницы и id тегов
+        загружаются одним запросом каждые, сами теги берутся
+        из реестра, а отметки избранного и корзины из кеша пользователя.
+        """
+        fields = self.selected_fields
+        if 'tags' in fields:
+            set_recipe_tag_ids(recipes)
+        user = self.context['request'].user
+        self.subscribed_ids = set()
+        if not user.is_authenticated:
+            return
+        if 'author' in fields and 'author' in self.expanded_fields:
+            self.subscribed_ids = set(
+                user.follower.filter(
+                    author_id__in={recipe.author_id for recipe in recipes}
+                ).values_list('author_id', flat=True)
+            )
+        if 'is_favorited' in fields or 'is_in_shopping_cart' in fields:
+            set_recipe_flags(recipes, user)
+
+    def get_image(self, image):
+        if not image:
+            return None
+        try:
+            url = image.url
+        except AttributeError:
+            return None
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_tags(self, recipe):
+        if 'tags' not in self.expanded_fields:
+            return recipe.tag_ids
+        return [
+            {
+                'id': tag.id, 'name': tag.name, 'color': tag.color,
+                'slug': tag.slug
+            }
+            for tag in tag_registry.get_ordered(recipe.tag_ids)
+        ]
+
+    def get_author(self, recipe):
+        if 'author' not in self.expanded_fields:
+            return recipe.author_id
+        user = self.context['request'].user
+        author = recipe.author
+        return {
+            'email': author.email,
+            'id': author.id,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': (
+                user.is_authenticated
+                and user.id != author.id
+                and author.id in self.subscribed_ids
+            ),
+        }
+
+    def get_ingredients(self, recipe):
+        if 'ingredients' not in self.expanded_fields:
+            return [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in recipe.recipeingredient_set.all()
+            ]
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipeingredient_set.all()
+        ]
+
+    def to_representation(self, recipe):
+        if self.subscribed_ids is None:
+            self.prepare([recipe])
+        data = {}
+        for field in self.selected_fields:
+            if field in ('tags', 'author', 'ingredients'):
+                data[field] = getattr(self, f'get_{field}')(recipe)
+            elif field == 'image':
+                data[field] = self.get_image(recipe.image)
+            elif field in ('is_favorited', 'is_in_shopping_cart'):
+                if hasattr(recipe, field):
+                    data[field] = bool(getattr(recipe, field))
+            else:
+                data[field] = getattr(recipe, field)
+        return data
+
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     author = UserSerializer(required=False)
     ingredients = RecipeIngredientWriteSerializer(many=True)
     image = Base64ImageField(required=False, allow_null=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
-    )
+    tags = TagPrimaryKeyField(queryset=Tag.objects.all(), many=True)
 
     class Meta:
         model = Recipe
@@ -129,9 +302,6 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Должен быть хотя бы один тег.')
         if len(value) != len(set(value)):
             raise serializers.ValidationError('Теги не должны повторяться!')
-        for tag in value:
-            if not Tag.objects.filter(id=tag.id).exists():
-                raise serializers.ValidationError(f'Тега {tag} не существует!')
         return value
 
     def validate_ingredients(self, value):
@@ -209,10 +379,21 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags')
         instance.tags.set(tags_data)
         instance = super().update(instance, validated_data)
+        ingredient_ids = list(
+            instance.recipeingredient_set.values_list(
+                'ingredient_id', flat=True
+            )
+        )
         instance.recipeingredient_set.all().delete()
         self.create_recipeingredient_objects(
             ingredients_data=ingredients_data, recipe=instance
         )
+        refresh_shopping_lists.delay(
+            recipe_id=instance.id,
+            ingredient_ids=ingredient_ids + [
+                ingredient['id'].id for ingredient in ingredients_data
+            ]
+        )
         return instance
 
     def to_representation(self, instance):
@@ -238,22 +419,34 @@ class UserWithRecipeSerializer(UserSerializer):
             'is_subscribed', 'recipes', 'recipes_count'
         ]
 
-    def get_recipes(self, obj):
-        limit = self.context['request'].query_params.get(
-            'recipes_limit', RECIPES_LIMIT
-        )
-        if limit is not None:
-            try:
-                limit = int(limit)
-            except ValueError:
-                raise ValueError(
+    @staticmethod
+    def get_recipes_limit(request):
+        limit = request.query_params.get('recipes_limit', RECIPES_LIMIT)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            raise serializers.ValidationError(
+                {'recipes_limit': [
                     'Парамерт "recipes_limit" должен быть числом.'
-                )
-        recipes = obj.recipes.all()[:limit]
+                ]}
+            )
+        return limit
+
+    def get_recipes(self, obj):
+        """Рецепты из подгруженного limited_recipes, если он есть."""
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()[
+                :self.get_recipes_limit(self.context['request'])
+            ]
         serializer = ShortRecipeReadSerializer(recipes, many=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -315,3 +508,29 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         """Изменение формата вывода поля recipe."""
         return ShortRecipeReadSerializer(instance.recipe).data
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных изменений и чтения."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=BULK_RECIPES_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
+class ServingsSerializer(serializers.Serializer):
+    """Количество порций рецепта в корзине."""
+    servings = serializers.IntegerField(
+        min_value=MIN_SERVINGS, max_value=MAX_SERVINGS, default=MIN_SERVINGS
+    )
+
+
+class SimilarRecipesSerializer(serializers.Serializer):
+    """Количество похожих рецептов в ответе."""
+    limit = serializers.IntegerField(
+        min_value=1, max_value=SIMILAR_MAX_LIMIT,
+        default=SIMILAR_RECIPES_LIMIT
+    )
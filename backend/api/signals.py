@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.tasks import schedule_snapshots
+from recipes.models import Ingredient, Recipe, Tag, User
+
+# Поля пользователя, которые попадают в снимки как данные автора.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def update_snapshots(**kwargs):
+    schedule_snapshots()
+
+
+@receiver(post_save, sender=User)
+def update_author_snapshots(created, update_fields=None, **kwargs):
+    """
+    У нового пользователя рецептов ещё нет, а сохранение только
+    last_login при входе снимки не меняет.
+    """
+    if created:
+        return
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        schedule_snapshots()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def update_ingredient_snapshots(instance, created=False, **kwargs):
+    """
+    Название и единица ингредиента выводятся в рецептах снимков,
+    а при удалении он пропадает из рецептов.
+    """
+    if not created and instance.ingredient_amount.exists():
+        schedule_snapshots()
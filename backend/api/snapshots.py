@@ -0,0 +1,163 @@
+"""
+Статические снимки ответов API для анонимных пользователей: список
+тегов и первые страницы рецептов без фильтров и с наборами тегов.
+Файлы лежат в SNAPSHOT_ROOT/<хост>/ под именами, которые nginx собирает
+из адреса запроса: /api/recipes/?page=1&limit=6 ->
+api/recipes/index?page=1&limit=6.json. Рядом пишется сжатая копия
+для gzip_static.
+"""
+import gzip
+import io
+import itertools
+import json
+import os
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import resolve
+from django.utils import timezone
+
+from foodgram.db_router import force_primary
+from recipes.constants import SNAPSHOT_MAX_TAGS
+from recipes.models import Tag
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def get_snapshot_paths():
+    """Адреса запросов со снимками в том виде, в каком их шлёт фронтенд."""
+    page = f'page=1&limit={settings.REST_FRAMEWORK["PAGE_SIZE"]}'
+    slugs = [
+        slug for slug in Tag.objects.values_list('slug', flat=True) if slug
+    ]
+    if len(slugs) <= SNAPSHOT_MAX_TAGS:
+        combinations = [
+            combination
+            for size in range(len(slugs) + 1)
+            for combination in itertools.combinations(slugs, size)
+        ]
+    else:
+        combinations = [()] + [(slug,) for slug in slugs] + [tuple(slugs)]
+    return ['/api/tags/', '/api/recipes/'] + [
+        f'/api/recipes/?{page}' + ''.join(f'&tags={slug}' for slug in tags)
+        for tags in combinations
+    ]
+
+
+def get_file_name(path):
+    url = urlsplit(path)
+    name = url.path.lstrip('/') + 'index'
+    if url.query:
+        name += '?' + url.query
+    return name + '.json'
+
+
+def make_request(path, host):
+    """
+    Анонимный GET-запрос. Тестовый APIRequestFactory не используется:
+    модуль загружается при старте процесса, а rest_framework.test
+    тянет за собой requests и django.test.
+    """
+    url = urlsplit(path)
+    return WSGIRequest({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'HTTP_HOST': host,
+        'SERVER_NAME': host,
+        'SERVER_PORT': '80',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+    })
+
+
+def render(path, host):
+    request = make_request(path, host)
+    match = resolve(request.path_info)
+    response = match.func(request, *match.args, **match.kwargs)
+    response.render()
+    return response
+
+
+def write_atomic(path, content):
+    """Запись через временный файл: nginx не увидит недописанный файл."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(content)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def remove_stale(root, names):
+    """Удаление снимков, которых нет в текущем наборе."""
+    for directory, _, files in os.walk(root):
+        for file in files:
+            name = os.path.relpath(os.path.join(directory, file), root)
+            if name.removesuffix('.gz') not in names:
+                os.unlink(os.path.join(directory, file))
+
+
+def publish_snapshots():
+    """
+    Перезапись снимков для всех SNAPSHOT_HOSTS. Ответ не 200 снимка
+    не получает, и такой запрос уходит в Django. Снимки читают только
+    основную базу: реплика сразу после изменения может отставать.
+    Возвращает манифест со временем генерации, её стоимостью
+    и размерами файлов.
+    """
+    with force_primary():
+        return write_snapshots()
+
+
+def write_snapshots():
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    paths = get_snapshot_paths()
+    files = {}
+    for host in settings.SNAPSHOT_HOSTS:
+        root = os.path.join(settings.SNAPSHOT_ROOT, host)
+        names = set()
+        for path in paths:
+            response = render(path, host)
+            if response.status_code != 200:
+                continue
+            name = get_file_name(path)
+            write_atomic(
+                os.path.join(root, name + '.gz'),
+                gzip.compress(response.content, compresslevel=9, mtime=0)
+            )
+            write_atomic(os.path.join(root, name), response.content)
+            names.add(name)
+            files[f'{host}/{name}'] = len(response.content)
+        remove_stale(root, names)
+    manifest = {
+        'generated_at': timezone.now().isoformat(),
+        'duration': time.perf_counter() - start,
+        'cpu_time': time.process_time() - start_cpu,
+        'files': files,
+    }
+    write_atomic(
+        os.path.join(settings.SNAPSHOT_ROOT, MANIFEST_NAME),
+        json.dumps(manifest, indent=2).encode()
+    )
+    return manifest
+
+
+def read_manifest():
+    """Манифест последней публикации или None."""
+    path = os.path.join(settings.SNAPSHOT_ROOT, MANIFEST_NAME)
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from api.snapshots import publish_snapshots
+from recipes.constants import SNAPSHOT_DELAY_SECONDS
+from tasks.registry import report_progress, task
+
+SCHEDULED_KEY = 'snapshots-scheduled'
+
+
+@task(concurrency=1)
+def publish_api_snapshots():
+    """Перезапись статических снимков ответов API."""
+    cache.delete(SCHEDULED_KEY)
+    manifest = publish_snapshots()
+    report_progress(
+        files=len(manifest['files']), cpu_time=manifest['cpu_time']
+    )
+
+
+def schedule_snapshots():
+    """
+    Публикация снимков через SNAPSHOT_DELAY_SECONDS: изменения,
+    сделанные за это время, попадают в одну публикацию.
+    """
+    if not settings.SNAPSHOT_HOSTS:
+        return
+    if cache.add(SCHEDULED_KEY, True, settings.TASKS_TIMEOUT):
+        publish_api_snapshots.delay(
+            run_at=timezone.now() + timedelta(seconds=SNAPSHOT_DELAY_SECONDS)
+        )
@@ -0,0 +1,178 @@
+from django.core.cache import cache
+from django.db import router
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import (
+    APIClient, APIRequestFactory, force_authenticate
+)
+from rest_framework.views import APIView
+
+from api.mixins import ReplicaRoutingMixin
+from foodgram.db_router import (
+    PRIMARY_DATABASE, force_primary, read_database, use_primary, use_replica
+)
+from recipes.models import Recipe, Tag, User
+
+REPLICA = 'replica_1'
+
+
+class RoutedView(ReplicaRoutingMixin, APIView):
+    """Отвечает базой, из которой читались бы рецепты."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response({'db': router.db_for_read(Recipe)})
+
+    def post(self, request):
+        return Response(
+            {'db': router.db_for_read(Recipe)},
+            status=request.data.get('status', status.HTTP_201_CREATED)
+        )
+
+
+class ReplicaRouterTests(TestCase):
+
+    def tearDown(self):
+        use_primary()
+
+    def test_primary_by_default(self):
+        self.assertEqual(router.db_for_read(Recipe), PRIMARY_DATABASE)
+        self.assertEqual(router.db_for_write(Recipe), PRIMARY_DATABASE)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_use_replica_falls_back_to_primary(self):
+        use_replica()
+        self.assertEqual(router.db_for_read(Recipe), PRIMARY_DATABASE)
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA])
+    def test_use_replica_routes_reads_only(self):
+        use_replica()
+        self.assertEqual(router.db_for_read(Recipe), REPLICA)
+        self.assertEqual(router.db_for_write(Recipe), PRIMARY_DATABASE)
+        use_primary()
+        self.assertEqual(router.db_for_read(Recipe), PRIMARY_DATABASE)
+
+    @override_settings(DATABASE_REPLICAS=[REPLICA])
+    def test_migrations_only_on_primary(self):
+        self.assertTrue(
+            router.allow_migrate(
+                PRIMARY_DATABASE, 'recipes', model_name='recipe'
+            )
+        )
+        self.assertFalse(
+            router.allow_migrate(REPLICA, 'recipes', model_name='recipe')
+        )
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingMixinTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password',
+            first_name='user', last_name='user'
+        )
+        cls.other = User.objects.create_user(
+            email='other@example.com', username='other',
+            password='password', first_name='other', last_name='other'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = RoutedView.as_view()
+
+    def request(self, method, user=None, **data):
+        request = getattr(self.factory, method)('/', data, format='json')
+        if user is not None:
+            force_authenticate(request, user)
+        return self.view(request)
+
+    def test_safe_method_reads_replica(self):
+        self.assertEqual(self.request('get').data['db'], REPLICA)
+        self.assertEqual(self.request('get', self.user).data['db'], REPLICA)
+
+    def test_unsafe_method_uses_primary(self):
+        response = self.request('post', self.user)
+        self.assertEqual(response.data['db'], PRIMARY_DATABASE)
+
+    def test_force_primary_overrides_safe_method(self):
+        with force_primary():
+            self.assertEqual(self.request('get').data['db'], PRIMARY_DATABASE)
+        self.assertEqual(self.request('get').data['db'], REPLICA)
+
+    def test_read_database_reset_after_request(self):
+        self.request('get', self.user)
+        self.assertEqual(read_database.get(), PRIMARY_DATABASE)
+
+    def test_write_pins_user_to_primary(self):
+        self.request('post', self.user)
+        self.assertEqual(
+            self.request('get', self.user).data['db'], PRIMARY_DATABASE
+        )
+        self.assertEqual(self.request('get', self.other).data['db'], REPLICA)
+        self.assertEqual(self.request('get').data['db'], REPLICA)
+
+    def test_pin_expires(self):
+        self.request('post', self.user)
+        cache.delete(RoutedView.get_pin_key(self.user))
+        self.assertEqual(self.request('get', self.user).data['db'], REPLICA)
+
+    def test_failed_write_does_not_pin(self):
+        self.request(
+            'post', self.user, status=status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(self.request('get', self.user).data['db'], REPLICA)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_primary(self):
+        self.assertEqual(
+            self.request('get', self.user).data['db'], PRIMARY_DATABASE
+        )
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class RecipeViewSetRoutingTests(TestCase):
+    """
+    Запросы API к двум отдельным базам. Теги в них разные, поэтому
+    ответ показывает, из какой базы прочитаны данные.
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password',
+            first_name='user', last_name='user'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='recipe', text='text', cooking_time=1,
+            image='recipes/images/recipe.png'
+        )
+        Tag.objects.create(name='Основная', color='#000000', slug='primary')
+        Tag.objects.using(REPLICA).create(
+            name='Реплика', color='#FFFFFF', slug='replica'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_tag_slugs(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [tag['slug'] for tag in response.json()]
+
+    def test_list_reads_replica(self):
+        self.assertEqual(self.get_tag_slugs(), ['replica'])
+
+    def test_read_after_write_uses_primary(self):
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.id}/favorite/'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.get_tag_slugs(), ['primary'])
@@ -0,0 +1,128 @@
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Exists, OuterRef
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import (
+    RecipeFastReadSerializer, RecipeReadSerializer, set_recipe_tag_ids
+)
+from api.views import RecipeViewSet
+from recipes.models import (
+    Favorite, Follow, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    Tag, User
+)
+
+
+class RecipeFastReadSerializerTests(TestCase):
+    """Вывод быстрого сериализатора совпадает с RecipeReadSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.other = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                password='password', first_name=name, last_name=name
+            )
+            for name in ('reader', 'author', 'other')
+        )
+        breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        recipes = []
+        for number, (author, tags, ingredients) in enumerate([
+            (cls.author, [breakfast, lunch], [(flour, 200), (milk, 300)]),
+            (cls.author, [lunch], [(milk, 100)]),
+            (cls.other, [], [(flour, 50)]),
+            (cls.reader, [breakfast], []),
+        ]):
+            recipe = Recipe.objects.create(
+                author=author, name=f'recipe {number}', text='text',
+                cooking_time=number + 1,
+                image=f'recipes/images/recipe_{number}.png'
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+                for ingredient, amount in ingredients
+            )
+            recipes.append(recipe)
+        Favorite.objects.create(follower=cls.reader, recipe=recipes[0])
+        ShoppingCart.objects.create(follower=cls.reader, recipe=recipes[0])
+        ShoppingCart.objects.create(follower=cls.reader, recipe=recipes[2])
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def get_context(self, user, action='list'):
+        request = Request(
+            APIRequestFactory().get('/api/recipes/', HTTP_HOST='testserver')
+        )
+        request.user = user
+        view = RecipeViewSet(
+            request=request, action=action, format_kwarg=None, kwargs={}
+        )
+        return view.get_queryset(), {'request': request}
+
+    def get_expected(self, user, action='list'):
+        """
+        Ожидаемый вывод по прежнему пути: отметки избранного и корзины
+        из аннотаций Exists, как их считал RecipeViewSet до кеша id.
+        """
+        queryset, context = self.get_context(user, action)
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(
+                    Favorite.objects.filter(
+                        follower=user, recipe_id=OuterRef('id')
+                    )
+                ),
+                is_in_shopping_cart=Exists(
+                    ShoppingCart.objects.filter(
+                        follower=user, recipe_id=OuterRef('id')
+                    )
+                )
+            )
+        recipes = list(queryset)
+        set_recipe_tag_ids(recipes)
+        return RecipeReadSerializer(recipes, many=True, context=context).data
+
+    def assert_same_list(self, user):
+        queryset, context = self.get_context(user)
+        self.assertEqual(
+            RecipeFastReadSerializer(
+                queryset, many=True, context=context
+            ).data,
+            self.get_expected(user)
+        )
+
+    def test_list_anonymous(self):
+        self.assert_same_list(AnonymousUser())
+
+    def test_list_authenticated(self):
+        self.assert_same_list(self.reader)
+
+    def test_list_author(self):
+        self.assert_same_list(self.author)
+
+    def test_flags_present(self):
+        """Сравнение не пустое: у читателя есть отмеченные рецепты."""
+        expected = self.get_expected(self.reader)
+        self.assertTrue(any(recipe['is_favorited'] for recipe in expected))
+        self.assertTrue(
+            any(recipe['is_in_shopping_cart'] for recipe in expected)
+        )
+
+    def test_retrieve(self):
+        for user in (AnonymousUser(), self.reader):
+            queryset, context = self.get_context(user, 'retrieve')
+            for expected in self.get_expected(user, 'retrieve'):
+                with self.subTest(user=user, recipe=expected['id']):
+                    recipe = queryset.get(pk=expected['id'])
+                    self.assertEqual(
+                        RecipeFastReadSerializer(recipe, context=context).data,
+                        expected
+                    )
@@ -0,0 +1,64 @@
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, User
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class DownloadShoppingCartTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password',
+            first_name='user', last_name='user'
+        )
+        units = {
+            unit: Ingredient.objects.create(
+                name=name, measurement_unit=unit
+            )
+            for name, unit in [
+                ('мука', 'г'), ('мука', 'кг'), ('молоко', 'мл'),
+                ('молоко', 'л'), ('яйца', 'шт.')
+            ]
+        }
+        cls.recipes = []
+        for number, ingredients in enumerate([
+            [('г', 500), ('мл', 200), ('шт.', 2)],
+            [('кг', 1), ('л', 1)],
+        ]):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'recipe {number}', text='text',
+                cooking_time=1, image=f'recipes/images/recipe_{number}.png'
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=units[unit], amount=amount
+                )
+                for unit, amount in ingredients
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_anonymous(self):
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_units_merged(self):
+        self.client.force_authenticate(self.user)
+        for recipe in self.recipes:
+            response = self.client.post(
+                f'/api/recipes/{recipe.id}/shopping_cart/', {'servings': 1}
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        title, *lines = response.content.decode().split('\n')
+        self.assertEqual(title, 'Список покупок:')
+        self.assertCountEqual(
+            lines, ['мука - 1500г', 'молоко - 1200мл', 'яйца - 2шт.']
+        )
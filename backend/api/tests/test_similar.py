@@ -0,0 +1,50 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Ingredient, Recipe, RecipeIngredient, RecipeSignature, Tag, User
+)
+
+
+class SimilarRecipesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='password', first_name='author', last_name='author'
+        )
+        tag = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+
+        def create(name, tags=(), ingredients=()):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text='text', cooking_time=1,
+                image=f'recipes/images/{name}.png'
+            )
+            recipe.tags.set(tags)
+            for ingredient in ingredients:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+            return recipe
+
+        cls.empty = [create(f'empty {number}') for number in range(3)]
+        cls.pie = create('pie', [tag], [flour])
+        cls.bread = create('bread', [tag], [flour])
+        RecipeSignature.objects.build(
+            Recipe.objects.values_list('id', flat=True)
+        )
+
+    def get_similar(self, recipe):
+        response = APIClient().get(f'/api/recipes/{recipe.id}/similar/')
+        return [item['id'] for item in response.json()]
+
+    def test_recipe_without_features_has_no_similar(self):
+        self.assertEqual(self.get_similar(self.empty[0]), [])
+
+    def test_recipes_without_features_not_suggested(self):
+        self.assertEqual(self.get_similar(self.pie), [self.bread.id])
+
+    def test_empty_signature_not_stale(self):
+        self.assertFalse(RecipeSignature.objects.stale().exists())
@@ -0,0 +1,110 @@
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import SimpleRateThrottle
+
+# Пополнение и списание жетонов одной командой Redis: параллельные
+# запросы с разных серверов не теряют списания друг друга.
+TAKE_TOKENS_SCRIPT = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(state[1]) or capacity
+local timestamp = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'timestamp',
+           tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+'''
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Корзина жетонов в общем кеше. Скорость из DEFAULT_THROTTLE_RATES
+    задаёт ёмкость корзины и скорость её пополнения, а запрос списывает
+    столько жетонов, сколько стоит действие: throttle_cost у вьюсета
+    или результат его метода get_throttle_cost().
+    """
+    cache_format = 'token-bucket:%(scope)s:%(ident)s'
+
+    @staticmethod
+    def get_cost(request, view):
+        get_throttle_cost = getattr(view, 'get_throttle_cost', None)
+        if get_throttle_cost is not None:
+            return get_throttle_cost()
+        return getattr(view, 'throttle_cost', 1)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        capacity = self.num_requests
+        rate = self.num_requests / self.duration
+        cost = min(self.get_cost(request, view), capacity)
+        if isinstance(caches['default'], RedisCache):
+            self.wait_time = self.take_tokens_atomic(capacity, rate, cost)
+        else:
+            self.wait_time = self.take_tokens(capacity, rate, cost)
+        return self.wait_time == 0
+
+    def take_tokens_atomic(self, capacity, rate, cost):
+        cache = caches['default']
+        client = cache._cache.get_client(self.key, write=True)
+        return float(
+            client.eval(
+                TAKE_TOKENS_SCRIPT, 1, cache.make_key(self.key),
+                capacity, rate, cost
+            )
+        )
+
+    def take_tokens(self, capacity, rate, cost):
+        """Вариант для кешей без атомарных скриптов."""
+        cache = caches['default']
+        now = time.time()
+        tokens, timestamp = cache.get(self.key, (capacity, now))
+        tokens = min(capacity, tokens + max(0, now - timestamp) * rate)
+        wait = 0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate
+        cache.set(self.key, (tokens, now), int(capacity / rate) + 1)
+        return wait
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Корзина авторизованного пользователя."""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope, 'ident': request.user.pk
+        }
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Корзина IP-адреса клиента, общая для всех его запросов."""
+    scope = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope, 'ident': self.get_ident(request)
+        }
@@ -1,7 +1,9 @@
+from django.urls import path
 from rest_framework import routers
 
 from .views import (
-    CustomUserViewSet, IngredientViewSet, RecipeViewSet, TagViewSet
+    CustomUserViewSet, IngredientViewSet, ReadinessView, RecipeViewSet,
+    TagViewSet
 )
 
 router = routers.DefaultRouter()
@@ -10,4 +12,6 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'users', CustomUserViewSet, basename='users')
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('ready/', ReadinessView.as_view(), name='ready'),
+] + router.urls
@@ -1,145 +1,537 @@
-from django.db.models import Exists, OuterRef, Sum
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count, Exists, Max, OuterRef, Prefetch, Q, Value
+)
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from rest_framework import permissions, status, viewsets
+from rest_framework import permissions, serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.views import APIView
 
-from api.filters import IngredientFilter, RecipeFilter
+from api import warmup
+from api.coalescing import single_flight
+from api.filters import IngredientFilter, RecipeFilter, UserFilter
+from api.mixins import (
+    ConditionalGetMixin, ReplicaRoutingMixin, make_etag
+)
+from api.pagination import FeedCursorPagination
+from recipes.constants import (
+    DOWNLOAD_SHOPPING_CART_COST, FEED_COST, INGREDIENTS_LIST_COST,
+    RECIPE_EXPANDABLE_FIELDS, RECIPE_FIELDS, RECIPES_BATCH_COST
+)
 from recipes.models import (
-    Favorite, Follow, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag,
-    User
+    FeedEntry, Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
+    RecipeSignature, ShoppingCart, ShoppingListItem, Tag, User
+)
+from recipes.tag_registry import tag_registry
+from recipes.tasks import (
+    backfill_feed, delete_recipes, delete_users, fan_out_recipe
 )
 from .serializers import (
-    FavoriteSerializer, FollowSerializer, IngredientSerializer,
-    RecipeReadSerializer, RecipeWriteSerializer, ShoppingCartSerializer,
-    TagSerializer, UserSerializer
+    FavoriteSerializer, IngredientSerializer, RecipeFastReadSerializer,
+    RecipeIdsSerializer, RecipeWriteSerializer, ServingsSerializer,
+    ShoppingCartSerializer, SimilarRecipesSerializer, TagSerializer,
+    UserSerializer, UserWithRecipeSerializer
 )
 
 
-class CustomUserViewSet(UserViewSet):
+def create_relation(model, unique_fields, **fields):
+    """
+    Создание связи без предварительной проверки на существование.
+    Повторное добавление отсекает ограничение уникальности в БД.
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.create(**fields)
+    except IntegrityError:
+        raise serializers.ValidationError(
+            {
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    UniqueTogetherValidator.message.format(
+                        field_names=', '.join(unique_fields)
+                    )
+                ]
+            },
+            code='unique'
+        )
+
+
+def delete_relation(model, **fields):
+    """Удаление связи одним запросом, возвращает число удалённых строк."""
+    deleted, _ = model.objects.filter(**fields).delete()
+    return deleted
+
+
+class CustomUserViewSet(ReplicaRoutingMixin, UserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = UserFilter
+
+    def get_queryset(self):
+        queryset = super().get_queryset().filter(
+            deleted_at__isnull=True
+        ).order_by('id')
+        user = self.request.user
+        if user.is_authenticated and self.action in ['list', 'retrieve']:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Follow.objects.filter(user=user, author_id=OuterRef('id'))
+                )
+            )
+        return queryset
+
+    def get_authors_queryset(self):
+        """
+        Авторы для UserWithRecipeSerializer с числом рецептов
+        и первыми recipes_limit рецептами: два запроса на страницу.
+        """
+        limit = UserWithRecipeSerializer.get_recipes_limit(self.request)
+        return User.objects.filter(deleted_at__isnull=True).annotate(
+            recipes_count=Count('recipes')
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=Recipe.objects.only(
+                    'id', 'author', 'name', 'image', 'cooking_time'
+                )[:limit],
+                to_attr='limited_recipes'
+            )
+        )
+
+    def perform_destroy(self, instance):
+        delete_users([instance])
 
     @action(methods=['get'], detail=False)
     def subscriptions(self, request):
-        user = request.user
-        following = user.follower.all()
-        page = self.paginate_queryset(following)
+        authors = self.get_authors_queryset().filter(
+            following__user=request.user
+        ).annotate(is_subscribed=Value(True)).order_by('following__id')
+        page = self.paginate_queryset(authors)
         if page is not None:
-            serializer = FollowSerializer(
+            serializer = UserWithRecipeSerializer(
                 page, many=True, context={'request': request}
             )
             return self.get_paginated_response(serializer.data)
-        serializer = FollowSerializer(
-            following, many=True, context={'request': request}
+        serializer = UserWithRecipeSerializer(
+            authors, many=True, context={'request': request}
         )
         return Response(serializer.data)
 
     @action(methods=['post', 'delete'], detail=True)
     def subscribe(self, request, id=None):
         user = request.user
-        following = User.objects.get(id=id)
         if self.request.method == 'POST':
-            serializer = FollowSerializer(
-                data={'user': user.id, 'author': id},
-                context={'request': request}
+            author = get_object_or_404(self.get_authors_queryset(), id=id)
+            if author == user:
+                raise serializers.ValidationError(
+                    {'author': ['Нельзя подписаться на самого себя!']}
+                )
+            create_relation(
+                Follow, ['user', 'author'], user=user, author=author
+            )
+            backfill_feed.delay(user_id=user.id, author_id=author.id)
+            author.is_subscribed = True
+            serializer = UserWithRecipeSerializer(
+                author, context={'request': request}
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        follow = get_object_or_404(Follow, user=user, author=following)
-        follow.delete()
+        if not delete_relation(Follow, user=user, author_id=id):
+            raise Http404
+        FeedEntry.objects.delete_for_follows([(user.id, id)])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(
+    ConditionalGetMixin, ReplicaRoutingMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     paginator = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin, ReplicaRoutingMixin, viewsets.ModelViewSet
+):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    read_actions = ['list', 'retrieve', 'feed', 'similar', 'batch']
+    replica_read_actions = ['batch']
+    validator_fields = ['updated_at', 'author__updated_at']
+    throttle_cost = 1
+
+    def get_field_list(self, name, allowed):
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        fields = [field for field in value.split(',') if field]
+        unknown = [field for field in fields if field not in allowed]
+        if not fields or unknown:
+            raise serializers.ValidationError(
+                {name: [f'Допустимые значения: {", ".join(allowed)}.']}
+            )
+        return fields
+
+    def get_field_selection(self):
+        """
+        Поля ответа из параметра fields (по умолчанию все)
+        и раскрываемые объекты из expand. Без expand объекты
+        раскрываются все, если fields не задан, и ни один, если задан.
+        """
+        if not hasattr(self, '_field_selection'):
+            fields = self.get_field_list('fields', RECIPE_FIELDS)
+            expand = self.get_field_list('expand', RECIPE_EXPANDABLE_FIELDS)
+            if fields is None:
+                self._field_selection = (
+                    RECIPE_FIELDS, expand or RECIPE_EXPANDABLE_FIELDS
+                )
+            else:
+                self._field_selection = (
+                    [field for field in RECIPE_FIELDS if field in fields],
+                    expand or []
+                )
+        return self._field_selection
 
     def get_queryset(self):
-        user = self.request.user
         queryset = Recipe.objects.all()
-        if user.is_authenticated:
-            queryset = queryset.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        follower=user, recipe_id=OuterRef('id')
-                    )
-                ),
-                is_in_shopping_cart=Exists(
-                    ShoppingCart.objects.filter(
-                        follower=user, recipe_id=OuterRef('id')
+        if self.action not in self.read_actions:
+            return queryset
+        # Рецепты удалённого пользователя скрываются сразу, не дожидаясь
+        # задачи purge_user.
+        queryset = queryset.filter(author__deleted_at__isnull=True)
+        fields, expand = self.get_field_selection()
+        columns = ['id', 'publication_date'] + [
+            field for field in ('name', 'image', 'text', 'cooking_time')
+            if field in fields
+        ]
+        if 'author' in fields:
+            columns.append('author')
+            if 'author' in expand:
+                queryset = queryset.select_related('author')
+                columns += [
+                    f'author__{field}' for field in (
+                        'email', 'username', 'first_name', 'last_name'
                     )
+                ]
+        if 'ingredients' in fields:
+            if 'ingredients' in expand:
+                items = RecipeIngredient.objects.select_related('ingredient')
+            else:
+                items = RecipeIngredient.objects.only(
+                    'recipe', 'ingredient', 'amount'
                 )
+            queryset = queryset.prefetch_related(
+                Prefetch('recipeingredient_set', queryset=items)
             )
-        return queryset
+        return queryset.only(*columns)
+
+    def get_etag_parts(self):
+        """В рецепты входят теги и ингредиенты из справочников."""
+        return [
+            tag_registry.version,
+            Ingredient.objects.aggregate(
+                version=Max('updated_at')
+            )['version']
+        ]
+
+    def get_validators(self):
+        """
+        Ответ авторизованному пользователю зависит от его избранного,
+        корзины и подписок, поэтому ETag для него строится с их учётом,
+        а Last-Modified не отдаётся.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return super().get_validators()
+        if self.action != 'retrieve':
+            return None
+        try:
+            row = self.get_queryset().filter(pk=self.kwargs['pk']).annotate(
+                is_subscribed=Exists(
+                    Follow.objects.filter(
+                        user=user, author_id=OuterRef('author_id')
+                    )
+                )
+            ).values_list(
+                'id', *self.validator_fields, 'is_subscribed'
+            ).first()
+        except (TypeError, ValueError):
+            return None
+        if row is None:
+            return None
+        recipe_id, *row = row
+        flags = [
+            recipe_id in model.objects.recipe_ids(user)
+            for model in (Favorite, ShoppingCart)
+        ]
+        return make_etag(
+            self.request.get_full_path(), user.id, *row, *flags,
+            *self.get_etag_parts()
+        ), None
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
-            return RecipeReadSerializer
+        if self.action in self.read_actions:
+            return RecipeFastReadSerializer
         return RecipeWriteSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in self.read_actions:
+            context['fields'], context['expand'] = (
+                self.get_field_selection()
+            )
+        return context
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        fan_out_recipe.delay(recipe_id=serializer.instance.id)
+
+    def perform_destroy(self, instance):
+        delete_recipes([instance])
+
     @action(methods=['post', 'delete'], detail=True)
     def favorite(self, request, pk=None):
         user = request.user
-        recipe = Recipe.objects.get(pk=pk)
         if self.request.method == 'POST':
-            serializer = FavoriteSerializer(
-                data={'follower': user.id, 'recipe': pk},
-                context={'request': request}
+            recipe = get_object_or_404(
+                Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+                pk=pk
+            )
+            relation = create_relation(
+                Favorite, ['follower', 'recipe'], follower=user, recipe=recipe
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            Favorite.objects.invalidate([user.id])
+            serializer = FavoriteSerializer(relation)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        favorite = get_object_or_404(Favorite, follower=user, recipe=recipe)
-        favorite.delete()
+        if not delete_relation(Favorite, follower=user, recipe_id=pk):
+            raise Http404
+        Favorite.objects.invalidate([user.id])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(methods=['post', 'delete'], detail=True)
+    @action(methods=['post', 'patch', 'delete'], detail=True)
     def shopping_cart(self, request, pk=None):
         user = request.user
-        recipe = Recipe.objects.get(pk=pk)
-        if self.request.method == 'POST':
-            serializer = ShoppingCartSerializer(
-                data={'follower': user.id, 'recipe': pk},
-                context={'request': request}
+        if self.request.method == 'DELETE':
+            if not delete_relation(ShoppingCart, follower=user, recipe_id=pk):
+                raise Http404
+            ShoppingCart.objects.invalidate([user.id])
+            ShoppingListItem.objects.refresh_for_recipes([user.id], [pk])
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        servings_serializer = ServingsSerializer(data=request.data)
+        servings_serializer.is_valid(raise_exception=True)
+        servings = servings_serializer.validated_data['servings']
+        if self.request.method == 'PATCH':
+            if not ShoppingCart.objects.filter(
+                follower=user, recipe_id=pk
+            ).update(servings=servings):
+                raise Http404
+            ShoppingListItem.objects.refresh_for_recipes([user.id], [pk])
+            return Response(servings_serializer.data)
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'name', 'image', 'cooking_time'), pk=pk
+        )
+        relation = create_relation(
+            ShoppingCart, ['follower', 'recipe'], follower=user,
+            recipe=recipe, servings=servings
+        )
+        ShoppingCart.objects.invalidate([user.id])
+        ShoppingListItem.objects.refresh_for_recipes([user.id], [pk])
+        serializer = ShoppingCartSerializer(relation)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def bulk_add_recipes(model, user, recipe_ids):
+        """Добавление рецептов одним INSERT с пропуском уже добавленных."""
+        recipes = dict(
+            Recipe.objects.filter(id__in=recipe_ids).annotate(
+                is_added=Exists(
+                    model.objects.filter(
+                        follower=user, recipe_id=OuterRef('id')
+                    )
+                )
+            ).values_list('id', 'is_added')
+        )
+        model.objects.bulk_create(
+            [
+                model(follower=user, recipe_id=recipe_id)
+                for recipe_id, is_added in recipes.items() if not is_added
+            ],
+            ignore_conflicts=True
+        )
+        results = []
+        for recipe_id in recipe_ids:
+            if recipe_id not in recipes:
+                result = 'not_found'
+            elif recipes[recipe_id]:
+                result = 'exists'
+            else:
+                result = 'added'
+            results.append({'id': recipe_id, 'status': result})
+        return results
+
+    @staticmethod
+    def bulk_remove_recipes(model, user, recipe_ids):
+        """Удаление рецептов одним DELETE."""
+        relations = model.objects.filter(
+            follower=user, recipe_id__in=recipe_ids
+        )
+        with transaction.atomic():
+            removed = set(relations.values_list('recipe_id', flat=True))
+            relations.delete()
+        return [
+            {
+                'id': recipe_id,
+                'status': 'removed' if recipe_id in removed else 'not_found'
+            }
+            for recipe_id in recipe_ids
+        ]
+
+    def bulk_change_recipes(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            results = self.bulk_add_recipes(model, request.user, recipe_ids)
+        else:
+            results = self.bulk_remove_recipes(
+                model, request.user, recipe_ids
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        shopping_cart = get_object_or_404(
-            ShoppingCart, follower=user, recipe=recipe
+        model.objects.invalidate([request.user.id])
+        return Response(results, status=status.HTTP_200_OK)
+
+    @action(
+        methods=['post', 'delete'], detail=False,
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def bulk_favorite(self, request):
+        return self.bulk_change_recipes(request, Favorite)
+
+    @action(
+        methods=['post', 'delete'], detail=False,
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def bulk_shopping_cart(self, request):
+        response = self.bulk_change_recipes(request, ShoppingCart)
+        ShoppingListItem.objects.refresh_for_recipes(
+            [request.user.id],
+            [result['id'] for result in response.data
+             if result['status'] in ('added', 'removed')]
         )
-        shopping_cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return response
 
-    @action(methods=['get'], detail=False)
+    @action(
+        methods=['get'], detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        pagination_class=FeedCursorPagination, throttle_cost=FEED_COST
+    )
+    @single_flight()
+    def feed(self, request):
+        """
+        Рецепты авторов из подписок, новые сверху. Основная часть
+        берётся из заранее разосланной ленты, рецепты авторов
+        с is_prolific — напрямую при запросе.
+        """
+        user = request.user
+        queryset = self.get_queryset().filter(
+            Q(id__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+            | Q(
+                author_id__in=Follow.objects.filter(
+                    user=user, author__is_prolific=True
+                ).values('author_id')
+            )
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get', 'post'], detail=False,
+        permission_classes=[permissions.AllowAny],
+        throttle_cost=RECIPES_BATCH_COST
+    )
+    def batch(self, request):
+        """
+        Рецепты по списку id (?ids=1,2,3 или {"ids": [...]} в теле POST)
+        в порядке запроса. Ненайденные id перечисляются в missing.
+        """
+        if request.method == 'GET':
+            ids = [
+                recipe_id for recipe_id
+                in request.query_params.get('ids', '').split(',')
+                if recipe_id
+            ]
+        elif isinstance(request.data, dict):
+            ids = request.data.get('ids')
+        else:
+            ids = None
+        serializer = RecipeIdsSerializer(data={'recipes': ids})
+        if not serializer.is_valid():
+            raise serializers.ValidationError(
+                {'ids': serializer.errors['recipes']}
+            )
+        recipe_ids = serializer.validated_data['recipes']
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return Response({
+            'results': self.get_serializer(
+                [
+                    recipes[recipe_id] for recipe_id in recipe_ids
+                    if recipe_id in recipes
+                ],
+                many=True
+            ).data,
+            'missing': [
+                recipe_id for recipe_id in recipe_ids
+                if recipe_id not in recipes
+            ]
+        })
+
+    @action(methods=['get'], detail=True)
+    def similar(self, request, pk):
+        """Рецепты с похожим набором ингредиентов и тегов."""
+        recipe = get_object_or_404(
+            Recipe.objects.filter(author__deleted_at__isnull=True).only('id'),
+            pk=pk
+        )
+        serializer = SimilarRecipesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = RecipeSignature.objects.similar(
+            recipe.id, serializer.validated_data['limit']
+        )
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return Response(
+            self.get_serializer(
+                [
+                    recipes[recipe_id] for recipe_id in recipe_ids
+                    if recipe_id in recipes
+                ],
+                many=True
+            ).data
+        )
+
+    @action(
+        methods=['get'], detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        throttle_cost=DOWNLOAD_SHOPPING_CART_COST
+    )
+    @single_flight()
     def download_shopping_cart(self, request):
         user = request.user
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__recipes_shoppingcart_related__follower_id=user.id
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
+        ingredients = ShoppingListItem.objects.for_user(user)
         groceries_list = 'Список покупок:'
         for ingredient in ingredients:
             groceries_list += (
                 f'\n'
-                f'{ingredient["ingredient__name"]}'
-                f' - {ingredient["amount"]}'
-                f'{ingredient["ingredient__measurement_unit"]}'
+                f'{ingredient["name"]}'
+                f' - {ingredient["total"]}'
+                f'{ingredient["measurement_unit"]}'
             )
         response = HttpResponse(groceries_list, content_type='text/plain')
         response['Content-Disposition'] = (
@@ -148,10 +540,49 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return response
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(
+    ConditionalGetMixin, ReplicaRoutingMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     paginator = None
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
+
+    def get_throttle_cost(self):
+        """Полный справочник без фильтра по имени дороже поиска."""
+        if self.action == 'list' and 'name' not in self.request.query_params:
+            return INGREDIENTS_LIST_COST
+        return 1
+
+    @single_flight(per_user=False)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class ReadinessView(APIView):
+    """
+    Готовность процесса для балансировщика: 503, пока воркер
+    не прогрет. Сам прогрев здесь не запускается: healthcheck
+    ограничен по времени, а неудавшийся прогрев воркер повторяет
+    в фоне.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = []
+
+    def get(self, request):
+        ready = warmup.is_ready()
+        return Response(
+            {
+                'ready': ready,
+                'warmed_at': warmup.state.finished_at,
+                'timings': warmup.state.timings,
+                'error': warmup.state.error,
+            },
+            status=(
+                status.HTTP_200_OK if ready
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        )
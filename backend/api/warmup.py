@@ -0,0 +1,101 @@
+"""
+Прогрев процесса перед приёмом запросов: соединения с базами, реестр
+тегов, справочник ингредиентов и горячие страницы рецептов. Страницы
+запрашиваются через сами вьюсеты, поэтому прогреваются и данные
+в PostgreSQL, и ленивые структуры Django и DRF в процессе.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections
+
+from api.snapshots import get_snapshot_paths, render
+from recipes.tag_registry import tag_registry
+
+# Пауза перед повтором неудавшегося прогрева, удваивается до предела.
+RETRY_DELAY = 1
+RETRY_MAX_DELAY = 60
+
+
+@dataclass
+class WarmupState:
+    finished_at: float = None
+    error: str = ''
+    timings: dict = field(default_factory=dict)
+
+
+state = WarmupState()
+
+
+def warm_connections(host):
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def warm_tags(host):
+    tag_registry.get_state()
+
+
+def warm_ingredients(host):
+    render('/api/ingredients/', host)
+
+
+def warm_recipes(host):
+    for path in get_snapshot_paths():
+        render(path, host)
+
+
+STEPS = [
+    ('connections', warm_connections),
+    ('tags', warm_tags),
+    ('ingredients', warm_ingredients),
+    ('recipes', warm_recipes),
+]
+
+
+def warm_up(host=None):
+    """Выполнение всех шагов, возвращает их длительность в секундах."""
+    host = host or settings.WARMUP_HOST
+    timings = {}
+    for name, step in STEPS:
+        start = time.perf_counter()
+        try:
+            step(host)
+        except Exception as error:
+            state.error = f'{name}: {error!r}'
+            raise
+        timings[name] = time.perf_counter() - start
+    state.timings = timings
+    state.error = ''
+    state.finished_at = time.time()
+    return timings
+
+
+def retry_in_background(log, host=None):
+    """
+    Повтор прогрева в фоновом потоке с растущей паузой, пока он
+    не удастся. Воркер тем временем работает, а /api/ready/ отвечает
+    503: например, при первом деплое, когда миграции ещё не применены,
+    или при кратком отказе базы.
+    """
+    def run():
+        delay = RETRY_DELAY
+        try:
+            while True:
+                time.sleep(delay)
+                try:
+                    return warm_up(host)
+                except Exception:
+                    log.exception('Повторный прогрев воркера не удался')
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, name='warmup', daemon=True).start()
+
+
+def is_ready():
+    """Без WARMUP_ON_START воркеры не прогреваются и готовы сразу."""
+    return state.finished_at is not None or not settings.WARMUP_ON_START
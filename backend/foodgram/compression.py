@@ -0,0 +1,146 @@
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    @staticmethod
+    def compressobj():
+        # wbits 16 + MAX_WBITS: заголовок и контрольная сумма gzip.
+        return zlib.compressobj(
+            settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED,
+            16 + zlib.MAX_WBITS
+        )
+
+    def compress(self, data):
+        compressor = self.compressobj()
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_sequence(self, chunks):
+        compressor = self.compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    @staticmethod
+    def compressobj():
+        return brotli.Compressor(
+            mode=brotli.MODE_TEXT,
+            quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+
+    def compress(self, data):
+        return brotli.compress(
+            data, mode=brotli.MODE_TEXT,
+            quality=settings.COMPRESSION_BROTLI_QUALITY
+        )
+
+    def compress_sequence(self, chunks):
+        compressor = self.compressobj()
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+# Кодировки в порядке предпочтения сервера.
+ENCODERS = [BrotliEncoder(), GzipEncoder()] if brotli else [GzipEncoder()]
+
+
+def parse_accept_encoding(header):
+    """Кодировки из Accept-Encoding с их весами q."""
+    weights = {}
+    for item in header.split(','):
+        coding, *params = item.strip().lower().split(';')
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip()] = weight
+    return weights
+
+
+def get_encoder(header):
+    """Лучшая кодировка из принимаемых клиентом или None."""
+    weights = parse_accept_encoding(header)
+    default = weights.get('*', 0.0)
+    accepted = [
+        encoder for encoder in ENCODERS
+        if weights.get(encoder.name, default) > 0
+    ]
+    if not accepted:
+        return None
+    return max(
+        accepted,
+        key=lambda encoder: weights.get(encoder.name, default)
+    )
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжатие ответов brotli или gzip по Accept-Encoding. Сжимаются только
+    типы из COMPRESSION_CONTENT_TYPES (JSON и текст API; HTML не
+    сжимается из-за атак вида BREACH на токены CSRF) размером от
+    COMPRESSION_MIN_SIZE байт, потоковые ответы сжимаются по частям.
+    Строгий ETag становится слабым: If-None-Match сравнивается
+    без учёта W/, поэтому ответы 304 продолжают работать.
+    """
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if (
+            content_type not in settings.COMPRESSION_CONTENT_TYPES
+            or response.has_header('Content-Encoding')
+            or 'no-transform' in response.get('Cache-Control', '')
+        ):
+            return response
+        patch_vary_headers(response, ['Accept-Encoding'])
+        if not response.streaming and (
+            len(response.content) < settings.COMPRESSION_MIN_SIZE
+        ):
+            return response
+        encoder = get_encoder(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoder is None:
+            return response
+        if response.streaming:
+            if response.is_async:
+                return response
+            response.streaming_content = encoder.compress_sequence(
+                response.streaming_content
+            )
+            del response['Content-Length']
+        else:
+            content = encoder.compress(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoder.name
+        return response
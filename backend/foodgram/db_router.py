@@ -0,0 +1,55 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_DATABASE = 'default'
+
+read_database = ContextVar('read_database', default=PRIMARY_DATABASE)
+primary_only = ContextVar('primary_only', default=False)
+
+
+def use_replica():
+    """Направить чтение текущего запроса на одну из реплик."""
+    if settings.DATABASE_REPLICAS and not primary_only.get():
+        read_database.set(random.choice(settings.DATABASE_REPLICAS))
+
+
+def use_primary():
+    read_database.set(PRIMARY_DATABASE)
+
+
+@contextmanager
+def force_primary():
+    """
+    Чтение только из основной базы, в том числе во вьюсетах,
+    которые сами выбирают реплику: для кода, которому нельзя
+    увидеть отставшие данные.
+    """
+    token = primary_only.set(True)
+    try:
+        use_primary()
+        yield
+    finally:
+        primary_only.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Запись всегда идёт в основную базу, чтение — в базу,
+    выбранную для текущего запроса (по умолчанию тоже в основную).
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Реплики получают схему репликацией, а не миграциями."""
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,284 @@
+"""
+Выборочный профилировщик запросов. На PROFILING_SAMPLE_RATE процентах
+запросов к маршрутам из PROFILING_ROUTES фоновый поток раз
+в PROFILING_INTERVAL_MS снимает стек потока, который обрабатывает
+запрос. Стеки копятся в памяти воркера и периодически дописываются
+в файл воркера в PROFILING_ROOT в формате collapsed stacks
+(«кадр;кадр;кадр число»), откуда их выгружают админка и команда
+export_profile. Без PROFILING_ENABLED middleware отключается при
+загрузке и не стоит ничего.
+"""
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+FLUSH_SECONDS = 10
+FILE_SUFFIX = '.collapsed'
+FRAME = re.compile(r'(?P<name>.*) \((?P<file>.*):(?P<line>\d+)\)')
+
+
+def get_frame_label(code):
+    """Кадр в виде «функция (файл:строка)» с путём от sys.path."""
+    file = code.co_filename
+    for path in sorted(filter(None, sys.path), key=len, reverse=True):
+        if file.startswith(path + os.sep):
+            file = file[len(path) + 1:]
+            break
+    return f'{code.co_name} ({file}:{code.co_firstlineno})'
+
+
+class Sampler:
+    """Фоновый поток, снимающий стеки потоков с профилируемыми запросами."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.active = {}
+        self.stacks = Counter()
+        self.labels = {}
+        self.pid = None
+
+    def start(self, route, root):
+        """Профилирование текущего потока ниже кадра root."""
+        with self.lock:
+            if self.pid != os.getpid():
+                # Поток не переживает fork, в новом процессе он
+                # запускается заново.
+                self.pid = os.getpid()
+                threading.Thread(
+                    target=self.run, name='profiler', daemon=True
+                ).start()
+            self.active[threading.get_ident()] = (route, root)
+        self.wakeup.set()
+
+    def stop(self):
+        self.active.pop(threading.get_ident(), None)
+
+    def get_label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = get_frame_label(code)
+        return label
+
+    def sample(self):
+        frames = sys._current_frames()
+        for thread_id, (route, root) in list(self.active.items()):
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None and frame is not root:
+                stack.append(self.get_label(frame.f_code))
+                frame = frame.f_back
+            if frame is None:
+                # Запрос уже завершился, кадр root вне стека.
+                continue
+            stack.append(route)
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def flush(self):
+        """Добавление накопленных стеков в файл воркера."""
+        stacks, self.stacks = self.stacks, Counter()
+        path = os.path.join(
+            settings.PROFILING_ROOT, f'{os.getpid()}{FILE_SUFFIX}'
+        )
+        try:
+            stacks.update(read_collapsed(path))
+            write_collapsed(path, stacks)
+        except OSError:
+            # Стеки остаются в памяти до следующей попытки.
+            self.stacks.update(stacks)
+
+    def run(self):
+        interval = settings.PROFILING_INTERVAL_MS / 1000
+        next_flush = time.monotonic() + FLUSH_SECONDS
+        while True:
+            now = time.monotonic()
+            if self.stacks and now >= next_flush:
+                self.flush()
+                next_flush = now + FLUSH_SECONDS
+            if self.active:
+                self.sample()
+                time.sleep(interval)
+                continue
+            self.wakeup.wait(
+                max(next_flush - now, 0) if self.stacks else None
+            )
+            self.wakeup.clear()
+
+
+sampler = Sampler()
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование выбранных запросов. Стоит первым в MIDDLEWARE:
+    в стеки попадают остальные middleware, вьюсет, сериализаторы
+    и фильтры.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    @staticmethod
+    def get_route(request):
+        """Имя маршрута, если запрос нужно профилировать, иначе None."""
+        if random.random() * 100 >= settings.PROFILING_SAMPLE_RATE:
+            return None
+        try:
+            route = resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+        if settings.PROFILING_ROUTES and (
+            route not in settings.PROFILING_ROUTES
+        ):
+            return None
+        return route
+
+    def __call__(self, request):
+        route = self.get_route(request)
+        if route is None:
+            return self.get_response(request)
+        sampler.start(route, sys._getframe())
+        try:
+            return self.get_response(request)
+        finally:
+            sampler.stop()
+
+
+def read_collapsed(path):
+    stacks = Counter()
+    try:
+        with open(path) as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                stacks[stack] += int(count)
+    except FileNotFoundError:
+        pass
+    return stacks
+
+
+def write_collapsed(path, stacks):
+    """Запись через временный файл: выгрузка не увидит половину файла."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix='.tmp'
+    )
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(to_collapsed(stacks))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def get_profile_files():
+    try:
+        names = os.listdir(settings.PROFILING_ROOT)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(settings.PROFILING_ROOT, name)
+        for name in names if name.endswith(FILE_SUFFIX)
+    ]
+
+
+def read_stacks(route=None):
+    """Стеки всех воркеров; route оставляет стеки одного маршрута."""
+    stacks = Counter()
+    for path in get_profile_files():
+        stacks.update(read_collapsed(path))
+    if route is not None:
+        prefix = route + ';'
+        stacks = Counter({
+            stack: count for stack, count in stacks.items()
+            if stack.startswith(prefix)
+        })
+    return stacks
+
+
+def clear_stacks():
+    for path in get_profile_files():
+        os.unlink(path)
+
+
+def to_collapsed(stacks):
+    return ''.join(
+        f'{stack} {count}\n' for stack, count in sorted(stacks.items())
+    )
+
+
+def to_speedscope(stacks, name='foodgram'):
+    """Профиль типа sampled в формате https://www.speedscope.app."""
+    frames = []
+    indexes = {}
+    samples = []
+    weights = []
+    for stack, count in sorted(stacks.items()):
+        sample = []
+        for label in stack.split(';'):
+            if label not in indexes:
+                indexes[label] = len(frames)
+                match = FRAME.fullmatch(label)
+                frames.append(
+                    {
+                        'name': match['name'],
+                        'file': match['file'],
+                        'line': int(match['line']),
+                    } if match else {'name': label}
+                )
+            sample.append(indexes[label])
+        samples.append(sample)
+        weights.append(count * settings.PROFILING_INTERVAL_MS)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'foodgram',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+
+def export_profile(stacks, format, name='foodgram'):
+    """Содержимое файла и его тип для формата collapsed или speedscope."""
+    if format == 'speedscope':
+        return json.dumps(to_speedscope(stacks, name)), 'application/json'
+    return to_collapsed(stacks), 'text/plain'
+
+
+def profile_view(request):
+    """
+    Выгрузка профиля из админки: /admin/profile/?format=speedscope
+    &route=recipes-list. Доступ только у персонала.
+    """
+    format = request.GET.get('format', 'collapsed')
+    route = request.GET.get('route') or None
+    content, content_type = export_profile(
+        read_stacks(route), format, route or 'foodgram'
+    )
+    extension = 'speedscope.json' if format == 'speedscope' else 'txt'
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="profile.{extension}"'
+    )
+    return response
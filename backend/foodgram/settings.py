@@ -1,7 +1,10 @@
 import os
+import sys
+import tempfile
 from pathlib import Path
 
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -24,10 +27,13 @@ INSTALLED_APPS = [
     'django_filters',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
+    'tasks.apps.TasksConfig',
 ]
 
 MIDDLEWARE = [
+    'foodgram.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -64,9 +70,59 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
         'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', cast=int, default=60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    config('DB_REPLICA_HOSTS', cast=Csv(), default=''), start=1
+):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+if sys.argv[1:2] == ['test']:
+    # Тесты маршрутизации читают из отдельной локальной базы вместо
+    # реплик: данные в ней расходятся с основной, и чтение не из той
+    # базы видно по ответу. В DATABASE_REPLICAS она включается
+    # только в этих тестах.
+    DATABASES = {
+        'default': DATABASES['default'],
+        'replica_1': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'replica_1.sqlite3',
+        },
+    }
+    DATABASE_REPLICAS = []
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', cast=int, default=5)
+
+REDIS_URL = config('REDIS_URL', default='')
+
+# Кеш, общий для всех воркеров. Без него кеш процесса не видит сбросов
+# из других воркеров: наборы id избранного и корзины не кешируются,
+# версия реестра тегов берётся из базы, а реплики не включаются.
+SHARED_CACHE = bool(REDIS_URL)
+
+if DATABASE_REPLICAS and not SHARED_CACHE:
+    raise ImproperlyConfigured(
+        'Для DB_REPLICA_HOSTS нужен REDIS_URL: закрепление пользователя '
+        'за основной базой после записи хранится в общем кеше.'
+    )
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -108,14 +164,69 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 6
+    'PAGE_SIZE': 6,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserTokenBucketThrottle',
+        'api.throttling.IPTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': config('THROTTLE_USER_RATE', default='120/min'),
+        'ip': config('THROTTLE_IP_RATE', default='600/min'),
+    },
+    'NUM_PROXIES': config('NUM_PROXIES', cast=int, default=1),
 }
 
+SINGLE_FLIGHT_TIMEOUT = 10
+SINGLE_FLIGHT_MAX_WAIT = 1
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+WARMUP_ON_START = config('WARMUP_ON_START', cast=bool, default=False)
+WARMUP_HOST = config('WARMUP_HOST', default=ALLOWED_HOSTS[0])
+
+SNAPSHOT_ROOT = config('SNAPSHOT_ROOT', default='/snapshots')
+SNAPSHOT_HOSTS = config('SNAPSHOT_HOSTS', cast=Csv(), default='')
+
+PROFILING_ENABLED = config('PROFILING_ENABLED', cast=bool, default=False)
+PROFILING_SAMPLE_RATE = config(
+    'PROFILING_SAMPLE_RATE', cast=float, default=1.0
+)
+PROFILING_ROUTES = config('PROFILING_ROUTES', cast=Csv(), default='')
+PROFILING_INTERVAL_MS = config('PROFILING_INTERVAL_MS', cast=int, default=5)
+PROFILING_ROOT = config(
+    'PROFILING_ROOT', default=os.path.join(tempfile.gettempdir(), 'profiles')
+)
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', cast=int, default=1024)
+COMPRESSION_GZIP_LEVEL = config('COMPRESSION_GZIP_LEVEL', cast=int, default=6)
+COMPRESSION_BROTLI_QUALITY = config(
+    'COMPRESSION_BROTLI_QUALITY', cast=int, default=5
+)
+COMPRESSION_CONTENT_TYPES = [
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/plain',
+]
+
 DJOSER = {
     'HIDE_USERS': False
 }
 
+TASKS_ALWAYS_EAGER = config('TASKS_ALWAYS_EAGER', cast=bool, default=False)
+TASKS_POLL_INTERVAL = 1
+TASKS_TIMEOUT = 600
+TASKS_RETENTION_DAYS = config('TASKS_RETENTION_DAYS', cast=int, default=7)
+TASKS_PRUNE_INTERVAL = 3600
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media'
 
@@ -1,7 +1,13 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from .profiling import profile_view
+
 urlpatterns = [
+    path(
+        'admin/profile/', admin.site.admin_view(profile_view),
+        name='profile'
+    ),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('api/', include('djoser.urls')),
@@ -0,0 +1,53 @@
+import gc
+
+from decouple import config
+
+# Приложение и URLconf загружаются один раз в мастере, воркеры получают
+# их через fork и делят страницы памяти с мастером.
+preload_app = config('GUNICORN_PRELOAD', cast=bool, default=True)
+
+
+def when_ready(server):
+    """
+    Подготовка мастера к fork при preload: загрузка URLconf со всеми
+    вьюсетами, закрытие соединений, которые воркеры не должны делить,
+    и gc.freeze(), чтобы сборщик мусора в воркерах не трогал объекты
+    мастера и не копировал их страницы.
+    """
+    if not server.cfg.preload_app:
+        return
+    from django.core.cache import caches
+    from django.db import connections
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    connections.close_all()
+    caches.close_all()
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """
+    Прогрев воркера до приёма первого запроса, если включён
+    WARMUP_ON_START. Ошибка прогрева не останавливает воркер: он
+    повторяет прогрев в фоне с растущей паузой, а /api/ready/ до
+    этого отвечает 503.
+    """
+    from django.conf import settings
+
+    if not settings.WARMUP_ON_START:
+        return
+    from api.warmup import retry_in_background, warm_up
+    try:
+        timings = warm_up()
+    except Exception:
+        worker.log.exception('Прогрев воркера не удался')
+        retry_in_background(worker.log)
+        return
+    worker.log.info(
+        'Воркер прогрет: %s',
+        ', '.join(
+            f'{name} {seconds * 1000:.0f} мс'
+            for name, seconds in timings.items()
+        )
+    )
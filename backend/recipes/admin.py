@@ -2,13 +2,35 @@ from django.contrib import admin
 
 from recipes.forms import RecipeForm, TagForm
 from recipes.models import (
-    Favorite, Follow, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
-    Tag, User
+    Favorite, FeedEntry, Follow, Ingredient, Recipe, RecipeIngredient,
+    ShoppingCart, ShoppingListItem, Tag, User
+)
+from recipes.tasks import (
+    backfill_feed, delete_recipes, delete_users, fan_out_recipe,
+    refresh_shopping_lists
 )
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_filter = ['email', 'username']
+    list_filter = ['email', 'username', 'deleted_at']
+    readonly_fields = ['deleted_at']
+
+    def delete_model(self, request, obj):
+        """Данные пользователя удаляются в фоне."""
+        delete_users([obj])
+
+    def delete_queryset(self, request, queryset):
+        delete_users(queryset)
+
+    def get_deleted_objects(self, objs, request):
+        """Связанные объекты на странице подтверждения не собираются."""
+        objs = list(objs)
+        return (
+            [str(obj) for obj in objs],
+            {self.model._meta.verbose_name_plural: len(objs)},
+            set(),
+            []
+        )
 
 
 class RecipeIngredientInLine(admin.TabularInline):
@@ -33,6 +55,99 @@ class RecipeAdmin(admin.ModelAdmin):
         'Количество добавлений рецепта в избранное'
     )
 
+    @staticmethod
+    def get_ingredient_ids(recipe):
+        return list(
+            recipe.recipeingredient_set.values_list('ingredient_id', flat=True)
+        )
+
+    def save_related(self, request, form, formsets, change):
+        """
+        Обновление списков покупок после изменения ингредиентов
+        и рассылка нового рецепта по лентам подписчиков.
+        """
+        ingredient_ids = self.get_ingredient_ids(form.instance)
+        super().save_related(request, form, formsets, change)
+        if not change:
+            fan_out_recipe.delay(recipe_id=form.instance.id)
+        refresh_shopping_lists.delay(
+            recipe_id=form.instance.id,
+            ingredient_ids=(
+                ingredient_ids + self.get_ingredient_ids(form.instance)
+            )
+        )
+
+    def delete_model(self, request, obj):
+        """Удаление с пересчётом списков покупок, как в API."""
+        delete_recipes([obj])
+
+    def delete_queryset(self, request, queryset):
+        delete_recipes(list(queryset))
+
+
+class RecipeFollowAdmin(admin.ModelAdmin):
+    """
+    Сброс кеша id рецептов пользователей после изменений, а для корзин
+    и пересчёт списков покупок.
+    """
+
+    def changed(self, user_ids, recipe_ids):
+        self.model.objects.invalidate(user_ids)
+        if self.model is ShoppingCart:
+            ShoppingListItem.objects.refresh_for_recipes(user_ids, recipe_ids)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        user_ids = {obj.follower_id}
+        recipe_ids = {obj.recipe_id}
+        if change:
+            if 'follower' in form.initial:
+                user_ids.add(form.initial['follower'])
+            if 'recipe' in form.initial:
+                recipe_ids.add(form.initial['recipe'])
+        self.changed(user_ids, recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.changed([obj.follower_id], [obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list('follower_id', 'recipe_id'))
+        super().delete_queryset(request, queryset)
+        self.changed(
+            {user_id for user_id, _ in rows},
+            {recipe_id for _, recipe_id in rows}
+        )
+
+
+class FollowAdmin(admin.ModelAdmin):
+    """
+    Ленты подписчиков меняются так же, как при подписке и отписке
+    через API: новая подписка дополняет ленту рецептами автора,
+    удалённая убирает их.
+    """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            old = (
+                form.initial.get('user', obj.user_id),
+                form.initial.get('author', obj.author_id)
+            )
+            if old == (obj.user_id, obj.author_id):
+                return
+            FeedEntry.objects.delete_for_follows([old])
+        backfill_feed.delay(user_id=obj.user_id, author_id=obj.author_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        FeedEntry.objects.delete_for_follows([(obj.user_id, obj.author_id)])
+
+    def delete_queryset(self, request, queryset):
+        pairs = list(queryset.values_list('user_id', 'author_id'))
+        super().delete_queryset(request, queryset)
+        FeedEntry.objects.delete_for_follows(pairs)
+
 
 class IngredientAdmin(admin.ModelAdmin):
     readonly_fields = ['id']
@@ -49,6 +164,6 @@ admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(RecipeIngredient)
-admin.site.register(Follow)
-admin.site.register(Favorite)
-admin.site.register(ShoppingCart)
+admin.site.register(Follow, FollowAdmin)
+admin.site.register(Favorite, RecipeFollowAdmin)
+admin.site.register(ShoppingCart, RecipeFollowAdmin)
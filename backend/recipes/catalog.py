@@ -0,0 +1,293 @@
+"""
+Каталог рецептов в формате NDJSON: одна строка — один рецепт
+с автором, тегами, ингредиентами и путём к картинке в хранилище.
+Связанные объекты описываются естественными ключами, поэтому файл
+можно загрузить в базу с другими id.
+"""
+import gzip
+import json
+import sys
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Follow, ImageBlob, Ingredient, Recipe, RecipeIngredient, Tag, User
+)
+from .tag_registry import tag_registry
+from .tasks import fan_out_recipe
+
+AUTHOR_FIELDS = ['email', 'username', 'first_name', 'last_name']
+TAG_FIELDS = ['name', 'color', 'slug']
+INGREDIENT_FIELDS = ['name', 'measurement_unit', 'amount']
+RECIPE_FIELDS = [
+    'id', 'author', 'tags', 'ingredients', 'name', 'image', 'text',
+    'cooking_time', 'publication_date'
+]
+
+
+@contextmanager
+def open_catalog(path, mode, compress=None):
+    """
+    Файл каталога для чтения ('r') или записи ('w'), '-' — стандартные
+    потоки. Сжатие gzip включается флагом или расширением .gz.
+    """
+    if compress is None:
+        compress = path.endswith('.gz')
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        if not compress:
+            yield stream
+            return
+        path = stream.buffer
+    if compress:
+        with gzip.open(path, mode + 't', encoding='utf-8') as file:
+            yield file
+    else:
+        with open(path, mode, encoding='utf-8') as file:
+            yield file
+
+
+def check_fields(value, fields, name):
+    """Объект с ровно заданными ключами, иначе ValueError."""
+    if not isinstance(value, dict):
+        raise ValueError(f'{name}: ожидается объект.')
+    missing = [field for field in fields if field not in value]
+    unknown = [field for field in value if field not in fields]
+    if missing:
+        raise ValueError(f'{name}: нет полей {", ".join(missing)}.')
+    if unknown:
+        raise ValueError(f'{name}: лишние поля {", ".join(unknown)}.')
+
+
+def parse_record(line):
+    """Рецепт из строки каталога с проверкой набора ключей."""
+    record = json.loads(line)
+    check_fields(record, RECIPE_FIELDS, 'рецепт')
+    check_fields(record['author'], AUTHOR_FIELDS, 'автор')
+    for name, fields in (
+        ('tags', TAG_FIELDS), ('ingredients', INGREDIENT_FIELDS)
+    ):
+        if not isinstance(record[name], list):
+            raise ValueError(f'{name}: ожидается список.')
+        for item in record[name]:
+            check_fields(item, fields, name)
+    return record
+
+
+def get_tag_key(tag):
+    return tag['slug'] or tag['name']
+
+
+def export_recipes(file, batch_size):
+    """Запись рецептов порциями через iterator(), возвращает их число."""
+    recipes = Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'recipeingredient_set',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        )
+    ).order_by('id')
+    count = 0
+    for recipe in recipes.iterator(chunk_size=batch_size):
+        file.write(
+            json.dumps(
+                {
+                    'id': recipe.id,
+                    'author': {
+                        field: getattr(recipe.author, field)
+                        for field in AUTHOR_FIELDS
+                    },
+                    'tags': [
+                        {field: getattr(tag, field) for field in TAG_FIELDS}
+                        for tag in recipe.tags.all()
+                    ],
+                    'ingredients': [
+                        {
+                            'name': item.ingredient.name,
+                            'measurement_unit':
+                                item.ingredient.measurement_unit,
+                            'amount': item.amount,
+                        }
+                        for item in recipe.recipeingredient_set.all()
+                    ],
+                    'name': recipe.name,
+                    'image': recipe.image.name or None,
+                    'text': recipe.text,
+                    'cooking_time': recipe.cooking_time,
+                    'publication_date': recipe.publication_date.isoformat(),
+                },
+                ensure_ascii=False
+            ) + '\n'
+        )
+        count += 1
+    return count
+
+
+class CatalogImporter:
+    """
+    Загрузка каталога порциями. Для каждой порции авторы, теги
+    и ингредиенты сопоставляются с существующими по естественным
+    ключам (недостающие создаются), а рецепты и их связи вставляются
+    через bulk_create. В памяти держатся только текущая порция
+    и справочники тегов и ингредиентов.
+    """
+
+    def __init__(self, batch_size, id_map=None):
+        self.batch_size = batch_size
+        self.id_map = id_map
+        self.tags_created = False
+        self.tag_ids = {
+            get_tag_key(tag): tag['id']
+            for tag in Tag.objects.values('id', *TAG_FIELDS)
+        }
+        self.ingredient_ids = {
+            (name, unit): ingredient_id
+            for ingredient_id, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        }
+
+    def run(self, file):
+        """Загрузка всех строк файла, возвращает число рецептов."""
+        count = 0
+        batch = []
+        try:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(parse_record(line))
+                except ValueError as error:
+                    raise ValueError(f'строка {number}: {error}')
+                if len(batch) >= self.batch_size:
+                    count += self.import_batch(batch)
+                    batch = []
+            if batch:
+                count += self.import_batch(batch)
+        finally:
+            if self.tags_created:
+                # bulk_create не вызывает сигналы, реестр тегов
+                # сбрасывается явно, в том числе после частичной загрузки.
+                tag_registry.invalidate()
+        return count
+
+    def get_author_ids(self, records):
+        authors = {
+            record['author']['email']: record['author'] for record in records
+        }
+        author_ids = dict(
+            User.objects.filter(email__in=authors).values_list('email', 'id')
+        )
+        missing = [
+            User(**author, password=make_password(None))
+            for email, author in authors.items() if email not in author_ids
+        ]
+        if missing:
+            User.objects.bulk_create(missing, ignore_conflicts=True)
+            author_ids = dict(
+                User.objects.filter(email__in=authors).values_list(
+                    'email', 'id'
+                )
+            )
+        for email in authors.keys() - author_ids.keys():
+            raise ValueError(
+                f'Не удалось создать автора {email}: '
+                'имя пользователя уже занято.'
+            )
+        return author_ids
+
+    def add_tags(self, records):
+        missing = {}
+        for record in records:
+            for tag in record['tags']:
+                if get_tag_key(tag) not in self.tag_ids:
+                    missing[get_tag_key(tag)] = Tag(**tag)
+        for key, tag in zip(
+            missing, Tag.objects.bulk_create(missing.values())
+        ):
+            self.tag_ids[key] = tag.id
+            self.tags_created = True
+
+    def add_ingredients(self, records):
+        missing = {}
+        for record in records:
+            for item in record['ingredients']:
+                key = (item['name'], item['measurement_unit'])
+                if key not in self.ingredient_ids:
+                    missing[key] = Ingredient(
+                        name=item['name'],
+                        measurement_unit=item['measurement_unit']
+                    )
+        if not missing:
+            return
+        Ingredient.objects.bulk_create(
+            missing.values(), ignore_conflicts=True
+        )
+        for ingredient_id, name, unit in Ingredient.objects.filter(
+            name__in={name for name, _ in missing}
+        ).values_list('id', 'name', 'measurement_unit'):
+            self.ingredient_ids[name, unit] = ingredient_id
+
+    @transaction.atomic
+    def import_batch(self, records):
+        author_ids = self.get_author_ids(records)
+        self.add_tags(records)
+        self.add_ingredients(records)
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author_id=author_ids[record['author']['email']],
+                name=record['name'],
+                image=record['image'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+            )
+            for record in records
+        )
+        # auto_now_add заполняет дату публикации при вставке,
+        # исходная дата возвращается отдельным запросом.
+        for recipe, record in zip(recipes, records):
+            recipe.publication_date = parse_datetime(
+                record['publication_date']
+            )
+        Recipe.objects.bulk_update(recipes, ['publication_date'])
+        # bulk_create не вызывает сигналы, ссылки на картинки
+        # учитываются явно.
+        ImageBlob.objects.add_references(
+            record['image'] for record in records
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=self.ingredient_ids[
+                    item['name'], item['measurement_unit']
+                ],
+                amount=item['amount']
+            )
+            for recipe, record in zip(recipes, records)
+            for item in record['ingredients']
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, record in zip(recipes, records)
+            for tag_id in {
+                self.tag_ids[get_tag_key(tag)] for tag in record['tags']
+            }
+        )
+        # Рецепты авторов с подписчиками рассылаются по лентам,
+        # как созданные через API.
+        followed_ids = set(
+            Follow.objects.filter(
+                author_id__in={recipe.author_id for recipe in recipes}
+            ).values_list('author_id', flat=True)
+        )
+        for recipe in recipes:
+            if recipe.author_id in followed_ids:
+                fan_out_recipe.delay(recipe_id=recipe.id)
+        if self.id_map is not None:
+            for recipe, record in zip(recipes, records):
+                self.id_map.write(f'{record["id"]},{recipe.id}\n')
+        return len(recipes)
@@ -6,3 +6,34 @@ REGEX_FOR_HEX_COLOR = '^#(?:[0-9a-fA-F]{3}){1,2}$'
 MIN_AMOUNT = 1
 MIN_COOKING_TIME = 1
 RECIPES_LIMIT = 3
+BULK_RECIPES_LIMIT = 100
+MIN_SERVINGS = 1
+MAX_SERVINGS = 100
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+FEED_PROLIFIC_RECIPES = 500
+FEED_BACKFILL_RECIPES = 50
+FEED_FAN_OUT_BATCH = 1000
+SIMILAR_NUM_PERM = 60
+SIMILAR_BANDS = 20
+SIMILAR_CANDIDATES = 500
+SIMILAR_RECIPES_LIMIT = 10
+SIMILAR_MAX_LIMIT = 50
+RECIPE_IDS_CACHE_SECONDS = 60 * 60
+DOWNLOAD_SHOPPING_CART_COST = 10
+FEED_COST = 5
+INGREDIENTS_LIST_COST = 5
+TAG_REGISTRY_CHECK_SECONDS = 1
+RECIPE_FIELDS = [
+    'id', 'tags', 'author', 'ingredients', 'is_favorited',
+    'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+]
+RECIPE_EXPANDABLE_FIELDS = ['tags', 'author', 'ingredients']
+RECIPES_BATCH_COST = 5
+IMAGE_BLOB_GRACE_SECONDS = 60 * 60
+USER_PURGE_BATCH_SIZE = 1000
+USER_PURGE_TIME_LIMIT = 60
+SNAPSHOT_MAX_TAGS = 4
+SNAPSHOT_DELAY_SECONDS = 5
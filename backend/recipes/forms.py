@@ -1,6 +1,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
 
+from foodgram.db_router import PRIMARY_DATABASE
 from recipes.models import Recipe, Tag
 
 
@@ -23,14 +24,23 @@ class TagForm(forms.ModelForm):
         model = Tag
         fields = '__all__'
 
+    def is_taken(self, **fields):
+        """
+        Проверка по основной базе, а не по реестру тегов: реестр
+        процесса может ещё не увидеть тег, созданный в другом воркере.
+        """
+        return Tag.objects.using(PRIMARY_DATABASE).filter(**fields).exclude(
+            pk=self.instance.pk
+        ).exists()
+
     def clean_name(self):
         name = self.cleaned_data.get('name')
-        if Tag.objects.filter(name=name).exists():
+        if self.is_taken(name=name):
             raise ValidationError('Тег с таким именем уже существует.')
         return name
 
     def clean_slug(self):
         slug = self.cleaned_data.get('slug')
-        if Tag.objects.filter(slug=slug).exists():
+        if self.is_taken(slug=slug):
             raise ValidationError('Slug с таким именем уже существует.')
         return slug
@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .constants import IMAGE_BLOB_GRACE_SECONDS
+from .models import ImageBlob, Recipe
+from .tasks import delete_unused_images
+
+
+def release_images(names):
+    """
+    Освобождение ссылок. Файлы без ссылок удаляются задачей после
+    IMAGE_BLOB_GRACE_SECONDS, если их не загрузят снова.
+    """
+    unused = ImageBlob.objects.release(names)
+    if unused:
+        delete_unused_images.delay(
+            names=unused,
+            run_at=timezone.now() + timedelta(
+                seconds=IMAGE_BLOB_GRACE_SECONDS
+            )
+        )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_previous_image(instance, update_fields=None, **kwargs):
+    if instance.pk is None or (
+        update_fields is not None and 'image' not in update_fields
+    ):
+        return
+    instance._previous_image = Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_references(instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    previous = instance.__dict__.pop('_previous_image', None)
+    current = instance.image.name or None
+    if current != previous:
+        ImageBlob.objects.add_references([current])
+        release_images([previous])
+
+
+@receiver(pre_delete, sender=Recipe)
+def release_deleted_image(instance, **kwargs):
+    # До удаления: отложенное поле image ещё можно дочитать из базы.
+    release_images([instance.image.name])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe, RecipeSignature
+
+
+class Command(BaseCommand):
+    help = (
+        'Построить индекс похожих рецептов. По умолчанию пересчитываются '
+        'только новые и изменённые рецепты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать подписи всех рецептов.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество рецептов в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            recipe_ids = Recipe.objects.values_list('id', flat=True)
+        else:
+            recipe_ids = RecipeSignature.objects.stale()
+        recipe_ids = list(recipe_ids.order_by('id'))
+        batch_size = options['batch_size']
+        built = 0
+        for start in range(0, len(recipe_ids), batch_size):
+            built += RecipeSignature.objects.build(
+                recipe_ids[start:start + batch_size]
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано подписей рецептов: {built}')
+        )
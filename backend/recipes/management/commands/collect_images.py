@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ImageBlob
+
+
+class Command(BaseCommand):
+    help = (
+        'Удалить файлы картинок, на которые не ссылается ни один рецепт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help=(
+                'Сначала пересчитать ссылки по рецептам и учесть все файлы '
+                'каталога картинок.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            counted = ImageBlob.objects.recount()
+            self.stdout.write(f'Пересчитано файлов: {counted}')
+        deleted = ImageBlob.objects.collect()
+        self.stdout.write(
+            self.style.SUCCESS(f'Удалено файлов картинок: {deleted}')
+        )
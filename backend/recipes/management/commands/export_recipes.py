@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.catalog import export_recipes, open_catalog
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить рецепты в файл NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Путь к файлу, "-" — стандартный вывод.'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', default=None,
+            help='Сжать файл (включается и расширением .gz).'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with open_catalog(options['path'], 'w', options['gzip']) as file:
+            count = export_recipes(file, options['batch_size'])
+        self.stderr.write(
+            self.style.SUCCESS(f'Выгружено рецептов: {count}')
+        )
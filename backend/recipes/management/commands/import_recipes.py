@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.tasks import schedule_snapshots
+from recipes.catalog import CatalogImporter, open_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузить рецепты из файла NDJSON. Рецепты получают новые id, '
+        'авторы, теги и ингредиенты сопоставляются по естественным '
+        'ключам, недостающие создаются. Рецепты авторов с подписчиками '
+        'рассылаются по лентам. Файлы картинок переносятся '
+        'в хранилище отдельно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Путь к файлу, "-" — стандартный ввод.'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', default=None,
+            help='Файл сжат (определяется и по расширению .gz).'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--id-map',
+            help='Файл CSV для пар "старый id,новый id" рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        id_map = None
+        if options['id_map']:
+            id_map = open(options['id_map'], 'w', encoding='utf-8')
+        try:
+            importer = CatalogImporter(options['batch_size'], id_map)
+            with open_catalog(options['path'], 'r', options['gzip']) as file:
+                count = importer.run(file)
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Ошибка в файле каталога: {error}')
+        finally:
+            if id_map is not None:
+                id_map.close()
+            # Рецепты вставлены без сигналов, снимки обновляются явно.
+            schedule_snapshots()
+        self.stdout.write(
+            self.style.SUCCESS(f'Загружено рецептов: {count}')
+        )
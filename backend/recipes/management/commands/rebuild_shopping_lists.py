@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать списки покупок пользователей по их корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='+', dest='user_ids',
+            help='id пользователей, по умолчанию все.'
+        )
+
+    def handle(self, *args, **options):
+        ShoppingListItem.objects.rebuild(user_ids=options['user_ids'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                'Строк в списках покупок: '
+                f'{ShoppingListItem.objects.count()}'
+            )
+        )
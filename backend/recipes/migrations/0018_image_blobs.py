@@ -0,0 +1,46 @@
+# Generated by Django 4.2.5 on 2026-10-19 05:10
+
+from django.db import migrations, models
+import recipes.storage
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageBlob = apps.get_model('recipes', 'ImageBlob')
+    ImageBlob.objects.bulk_create(
+        [
+            ImageBlob(name=name, references=count)
+            for name, count in Recipe.objects.exclude(
+                image__isnull=True
+            ).exclude(image='').order_by().values('image').annotate(
+                count=models.Count('id')
+            ).values_list('image', 'count')
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_user_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, default=None, null=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Фотография'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
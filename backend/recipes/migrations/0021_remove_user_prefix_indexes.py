@@ -0,0 +1,21 @@
+# Generated by Django 4.2.5 on 2026-10-19 09:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_username_prefix_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_email_prefix_idx',
+        ),
+    ]
@@ -1,15 +1,53 @@
+import time
+from array import array
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.db.models.functions import Greatest
+from django.utils import timezone
 
 from .constants import (
-    MAX_COLOR_FIELD_LENGTH, MAX_EMAIL_LENGTH, MAX_FIELD_LENGTH,
-    MAX_NAMES_LENGTH
+    IMAGE_BLOB_GRACE_SECONDS, MAX_COLOR_FIELD_LENGTH, MAX_EMAIL_LENGTH,
+    MAX_FIELD_LENGTH, MAX_NAMES_LENGTH, MAX_SERVINGS, MIN_SERVINGS,
+    RECIPE_IDS_CACHE_SECONDS, SIMILAR_CANDIDATES, UNIT_CONVERSIONS
+)
+from .similarity import (
+    estimate_similarity, get_buckets, get_features, get_signature
 )
+from .storage import ContentAddressedStorage
 from .validators import (
     validate_ingredient_amount, validate_cooking_time, validate_hex_color
 )
 
+# Таблица пересчёта единиц в виде выражений SQL: пересчёт выполняется
+# базой за один проход по строкам списка покупок.
+BASE_UNIT = models.Case(
+    *[
+        models.When(
+            ingredient__measurement_unit=unit, then=models.Value(base)
+        )
+        for unit, (base, _) in UNIT_CONVERSIONS.items()
+    ],
+    default=models.F('ingredient__measurement_unit'),
+    output_field=models.CharField()
+)
+UNIT_FACTOR = models.Case(
+    *[
+        models.When(
+            ingredient__measurement_unit=unit, then=models.Value(factor)
+        )
+        for unit, (_, factor) in UNIT_CONVERSIONS.items()
+    ],
+    default=models.Value(1),
+    output_field=models.PositiveIntegerField()
+)
+
 
 class User(AbstractUser):
     email = models.EmailField(
@@ -26,6 +64,15 @@ class User(AbstractUser):
     last_name = models.CharField(
         max_length=MAX_NAMES_LENGTH, verbose_name='Фамилия'
     )
+    is_prolific = models.BooleanField(
+        default=False, verbose_name='Рецепты читаются из ленты при запросе'
+    )
+    deleted_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Дата удаления'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -45,6 +92,9 @@ class Ingredient(models.Model):
     measurement_unit = models.CharField(
         max_length=MAX_FIELD_LENGTH, verbose_name='Единицы измерения'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name='Дата изменения'
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -72,6 +122,9 @@ class Tag(models.Model):
     slug = models.CharField(
         max_length=MAX_FIELD_LENGTH, null=True
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, db_index=True, verbose_name='Дата изменения'
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -99,7 +152,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         verbose_name='Фотография', upload_to='recipes/images/', null=True,
-        default=None, blank=True
+        default=None, blank=True, storage=ContentAddressedStorage()
     )
     text = models.TextField(verbose_name='Описание')
     cooking_time = models.PositiveSmallIntegerField(
@@ -109,6 +162,9 @@ class Recipe(models.Model):
     publication_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
@@ -167,6 +223,64 @@ class Follow(models.Model):
         )
 
 
+class RecipeFollowManager(models.Manager):
+    """
+    Кеш множеств id рецептов пользователя. Ключ данных содержит версию,
+    которая увеличивается после каждого изменения: набор, собранный
+    параллельно с изменением, сохраняется под старой версией
+    и больше не читается.
+    """
+
+    def get_version_key(self, user_id):
+        return f'recipe-ids-version:{self.model._meta.model_name}:{user_id}'
+
+    def get_version(self, user_id):
+        key = self.get_version_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            # Начальная версия берётся из времени, чтобы после вытеснения
+            # ключа из кеша не прочитать набор, сохранённый раньше.
+            cache.add(key, time.time_ns(), None)
+            version = cache.get(key)
+        return version
+
+    def load_recipe_ids(self, user):
+        return array(
+            'q',
+            self.filter(follower=user).order_by('recipe_id').values_list(
+                'recipe_id', flat=True
+            )
+        )
+
+    def recipe_ids(self, user):
+        """
+        Отсортированный массив id рецептов пользователя. Без общего
+        кеша (SHARED_CACHE) читается из базы.
+        """
+        if not settings.SHARED_CACHE:
+            return self.load_recipe_ids(user)
+        version = self.get_version(user.id)
+        key = f'recipe-ids:{self.model._meta.model_name}:{user.id}:{version}'
+        recipe_ids = cache.get(key)
+        if recipe_ids is None:
+            recipe_ids = self.load_recipe_ids(user)
+            cache.set(key, recipe_ids, RECIPE_IDS_CACHE_SECONDS)
+        return recipe_ids
+
+    def invalidate(self, user_ids):
+        """Сброс кеша пользователей после фиксации транзакции."""
+        if not settings.SHARED_CACHE:
+            return
+
+        def incr_versions():
+            for user_id in user_ids:
+                try:
+                    cache.incr(self.get_version_key(user_id))
+                except ValueError:
+                    pass
+        transaction.on_commit(incr_versions)
+
+
 class RecipeFollow(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE,
@@ -177,6 +291,8 @@ class RecipeFollow(models.Model):
         related_name='follower_%(app_label)s_%(class)s_related'
     )
 
+    objects = RecipeFollowManager()
+
     class Meta:
         abstract = True
 
@@ -197,6 +313,13 @@ class Favorite(RecipeFollow):
 
 
 class ShoppingCart(RecipeFollow):
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Количество порций', default=MIN_SERVINGS,
+        validators=[
+            MinValueValidator(MIN_SERVINGS), MaxValueValidator(MAX_SERVINGS)
+        ]
+    )
+
     class Meta:
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзины покупок'
@@ -209,3 +332,430 @@ class ShoppingCart(RecipeFollow):
 
     def __str__(self):
         return f'{self.recipe} (Подписчик: {self.follower})'
+
+
+class FeedEntryManager(models.Manager):
+
+    def delete_for_follows(self, pairs):
+        """
+        Записи ленты по удалённым подпискам, парам (подписчик, автор).
+        Запросы группируются по стороне, общей для большинства пар:
+        у подписчиков одного автора это автор, у подписок одного
+        пользователя — подписчик.
+        """
+        authors = defaultdict(list)
+        users = defaultdict(list)
+        for user_id, author_id in pairs:
+            authors[author_id].append(user_id)
+            users[user_id].append(author_id)
+        if len(authors) <= len(users):
+            for author_id, user_ids in authors.items():
+                self.filter(
+                    user_id__in=user_ids, recipe__author_id=author_id
+                ).delete()
+        else:
+            for user_id, author_ids in users.items():
+                self.filter(
+                    user_id=user_id, recipe__author_id__in=author_ids
+                ).delete()
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт автора из подписок, разосланный в ленту пользователя.
+    Рецепты авторов с is_prolific в ленту не пишутся и
+    добавляются при чтении.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='feed'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='feed_entries'
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} (Лента: {self.user})'
+
+
+class ShoppingListManager(models.Manager):
+
+    def totals(self, user_ids, ingredient_ids=None):
+        """Суммы ингредиентов из корзин пользователей по исходным данным."""
+        follower = 'recipe__recipes_shoppingcart_related__follower_id'
+        queryset = RecipeIngredient.objects.filter(**{
+            f'{follower}__in': user_ids
+        })
+        if ingredient_ids is not None:
+            queryset = queryset.filter(ingredient_id__in=ingredient_ids)
+        return queryset.values(
+            'ingredient_id', user_id=models.F(follower)
+        ).annotate(
+            total=models.Sum(
+                models.F('amount')
+                * models.F('recipe__recipes_shoppingcart_related__servings')
+            )
+        ).order_by()
+
+    def refresh(self, user_ids, ingredient_ids):
+        """
+        Пересчёт строк списка покупок только для затронутых ингредиентов.
+        Вызывается при изменении корзины или состава рецепта.
+        """
+        items = [
+            self.model(
+                user_id=row['user_id'], ingredient_id=row['ingredient_id'],
+                amount=row['total']
+            )
+            for row in self.totals(user_ids, ingredient_ids)
+        ]
+        with transaction.atomic():
+            self.filter(
+                user_id__in=user_ids, ingredient_id__in=ingredient_ids
+            ).delete()
+            self.bulk_create(
+                items, update_conflicts=True,
+                unique_fields=['user', 'ingredient'], update_fields=['amount']
+            )
+
+    def refresh_for_recipes(self, user_ids, recipe_ids):
+        self.refresh(
+            user_ids,
+            RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values('ingredient_id')
+        )
+
+    def for_user(self, user):
+        """
+        Список покупок, в котором совместимые единицы (г и кг, мл и л)
+        приведены к базовой и просуммированы.
+        """
+        return self.filter(user=user).values(
+            name=models.F('ingredient__name'), measurement_unit=BASE_UNIT
+        ).annotate(
+            total=models.Sum(models.F('amount') * UNIT_FACTOR)
+        ).order_by()
+
+    def refresh_for_recipe(self, recipe, ingredient_ids):
+        """Пересчёт у всех, кто держит рецепт в корзине."""
+        self.refresh(
+            ShoppingCart.objects.filter(recipe=recipe).values('follower_id'),
+            ingredient_ids
+        )
+
+    def rebuild(self, user_ids=None, batch_size=1000):
+        """Полный пересчёт списков покупок для исправления расхождений."""
+        if user_ids is None:
+            user_ids = ShoppingCart.objects.values('follower_id')
+            stale = self.all()
+        else:
+            stale = self.filter(user_id__in=user_ids)
+        with transaction.atomic():
+            stale.delete()
+            items = []
+            for row in self.totals(user_ids).iterator(chunk_size=batch_size):
+                items.append(
+                    self.model(
+                        user_id=row['user_id'],
+                        ingredient_id=row['ingredient_id'],
+                        amount=row['total']
+                    )
+                )
+                if len(items) >= batch_size:
+                    self.bulk_create(items)
+                    items = []
+            self.bulk_create(items)
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, related_name='+'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount} ({self.user})'
+
+
+class RecipeSignatureManager(models.Manager):
+
+    @staticmethod
+    def get_features(recipe_ids):
+        """Признаки рецептов, загруженные двумя запросами."""
+        ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+        tags = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].append(ingredient_id)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag_id'):
+            tags[recipe_id].append(tag_id)
+        return {
+            recipe_id: get_features(ingredients[recipe_id], tags[recipe_id])
+            for recipe_id in recipe_ids
+        }
+
+    def stale(self):
+        """id рецептов без подписи или изменённых после её построения."""
+        return Recipe.objects.filter(
+            models.Q(signature__isnull=True)
+            | models.Q(updated_at__gt=models.F('signature__built_at'))
+        ).values_list('id', flat=True)
+
+    def build(self, recipe_ids):
+        """Пересчёт подписей и корзин LSH для рецептов."""
+        built_at = timezone.now()
+        recipe_ids = list(
+            Recipe.objects.filter(id__in=recipe_ids).values_list(
+                'id', flat=True
+            )
+        )
+        signatures = {
+            recipe_id: get_signature(features)
+            for recipe_id, features in self.get_features(recipe_ids).items()
+        }
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(
+                        recipe_id=recipe_id, signature=signature,
+                        built_at=built_at
+                    )
+                    for recipe_id, signature in signatures.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['recipe'],
+                update_fields=['signature', 'built_at']
+            )
+            RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+            RecipeBucket.objects.bulk_create(
+                RecipeBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+                for recipe_id, signature in signatures.items()
+                for band, bucket in get_buckets(signature)
+            )
+        return len(recipe_ids)
+
+    def similar(self, recipe_id, limit):
+        """
+        id похожих рецептов по убыванию сходства. Кандидаты берутся
+        из общих корзин LSH, затем сортируются по оценке по подписям.
+        У рецепта без ингредиентов и тегов похожих нет.
+        """
+        signature = self.filter(recipe_id=recipe_id).values_list(
+            'signature', flat=True
+        ).first()
+        if signature is None:
+            signature = get_signature(
+                self.get_features([recipe_id])[recipe_id]
+            )
+        if not signature:
+            return []
+        query = models.Q()
+        for band, bucket in get_buckets(signature):
+            query |= models.Q(band=band, bucket=bucket)
+        candidates = RecipeBucket.objects.filter(query).exclude(
+            recipe_id=recipe_id
+        ).values('recipe_id').annotate(
+            shared=models.Count('id')
+        ).order_by('-shared').values_list(
+            'recipe_id', flat=True
+        )[:SIMILAR_CANDIDATES]
+        scores = [
+            (estimate_similarity(signature, other), other_id)
+            for other_id, other in self.filter(
+                recipe_id__in=list(candidates)
+            ).values_list('recipe_id', 'signature')
+        ]
+        scores.sort(key=lambda score: (-score[0], score[1]))
+        return [other_id for _, other_id in scores[:limit]]
+
+
+class RecipeSignature(models.Model):
+    """MinHash-подпись множества ингредиентов и тегов рецепта."""
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True,
+        related_name='signature'
+    )
+    signature = models.JSONField(verbose_name='Подпись')
+    built_at = models.DateTimeField(verbose_name='Дата построения')
+
+    objects = RecipeSignatureManager()
+
+    class Meta:
+        verbose_name = 'Подпись рецепта'
+        verbose_name_plural = 'Подписи рецептов'
+
+    def __str__(self):
+        return f'{self.recipe} ({self.built_at})'
+
+
+class RecipeBucket(models.Model):
+    """Корзина LSH: рецепты с одинаковой полосой подписи."""
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='buckets'
+    )
+    band = models.PositiveSmallIntegerField(verbose_name='Полоса')
+    bucket = models.BigIntegerField(verbose_name='Хеш полосы')
+
+    class Meta:
+        verbose_name = 'Корзина LSH'
+        verbose_name_plural = 'Корзины LSH'
+        indexes = [
+            models.Index(
+                fields=['band', 'bucket'], name='recipe_bucket_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ({self.band}: {self.bucket})'
+
+
+class ImageBlobManager(models.Manager):
+
+    def change_references(self, names, delta):
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+        self.bulk_create(
+            [self.model(name=name) for name in counts], ignore_conflicts=True
+        )
+        names_by_count = defaultdict(list)
+        for name, count in counts.items():
+            names_by_count[count].append(name)
+        for count, group in names_by_count.items():
+            self.filter(name__in=group).update(
+                references=Greatest(models.F('references') + delta * count, 0)
+            )
+
+    def add_references(self, names):
+        self.change_references(names, 1)
+
+    def release(self, names):
+        """Уменьшение счётчиков, возвращает имена файлов без ссылок."""
+        names = [name for name in names if name]
+        self.change_references(names, -1)
+        return list(
+            self.filter(name__in=names, references=0).values_list(
+                'name', flat=True
+            )
+        )
+
+    def recount(self):
+        """
+        Пересчёт ссылок по рецептам. Файлы каталога картинок без записи
+        о них тоже учитываются, чтобы их можно было удалить.
+        """
+        field = Recipe._meta.get_field('image')
+        names = dict.fromkeys(walk_storage(field.storage, field.upload_to), 0)
+        names.update(
+            Recipe.objects.exclude(image__isnull=True).exclude(
+                image=''
+            ).order_by().values('image').annotate(
+                count=models.Count('id')
+            ).values_list('image', 'count')
+        )
+        with transaction.atomic():
+            self.update(references=0)
+            self.bulk_create(
+                [
+                    self.model(name=name, references=count)
+                    for name, count in names.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=['references']
+            )
+        return len(names)
+
+    def collect(self, names=None):
+        """
+        Удаление файлов без ссылок, не изменявшихся дольше
+        IMAGE_BLOB_GRACE_SECONDS: повторная загрузка обновляет время
+        изменения файла, и он не удаляется, пока ссылка на него ещё
+        не сохранена. Возвращает число удалённых файлов.
+        """
+        storage = Recipe._meta.get_field('image').storage
+        deadline = timezone.now() - timedelta(
+            seconds=IMAGE_BLOB_GRACE_SECONDS
+        )
+        blobs = self.filter(references=0)
+        if names is not None:
+            blobs = blobs.filter(name__in=names)
+        deleted = 0
+        for name in blobs.values_list('name', flat=True).iterator():
+            with transaction.atomic():
+                if not self.select_for_update(skip_locked=True).filter(
+                    name=name, references=0
+                ).exists():
+                    continue
+                try:
+                    modified = storage.get_modified_time(name)
+                except FileNotFoundError:
+                    modified = None
+                if modified is not None:
+                    if modified > deadline:
+                        continue
+                    storage.delete(name)
+                    deleted += 1
+                self.filter(name=name).delete()
+        return deleted
+
+
+def walk_storage(storage, path):
+    """Имена всех файлов каталога хранилища и его подкаталогов."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for file in files:
+        yield path.rstrip('/') + '/' + file
+    for directory in directories:
+        yield from walk_storage(storage, path.rstrip('/') + '/' + directory)
+
+
+class ImageBlob(models.Model):
+    """Файл картинки и число рецептов, которые на него ссылаются."""
+    name = models.CharField(
+        max_length=100, primary_key=True, verbose_name='Имя файла'
+    )
+    references = models.PositiveIntegerField(
+        default=0, verbose_name='Число ссылок'
+    )
+
+    objects = ImageBlobManager()
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
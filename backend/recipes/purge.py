@@ -0,0 +1,100 @@
+"""
+Удаление пользователя, отмеченного удалённым, и всех его данных
+порциями. Каждая порция — короткая транзакция по списку id: блокировки
+держатся недолго, а память не зависит от объёма данных. Сначала
+удаляются рецепты пользователя со связанными строками, затем его
+подписки, избранное, корзина и лента, и в конце сам пользователь.
+"""
+import time
+
+from django.db import transaction
+
+from .models import (
+    Favorite, FeedEntry, Follow, Recipe, RecipeBucket, RecipeIngredient,
+    RecipeSignature, ShoppingCart, ShoppingListItem, User
+)
+
+
+class UserPurger:
+
+    def __init__(self, user_id, batch_size, deleted=None):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.deleted = deleted or {}
+
+    def get_steps(self):
+        """Шаги удаления: имя для прогресса и строки, которые удаляются."""
+        user_id = self.user_id
+        recipes = {'recipe__author_id': user_id}
+        return [
+            ('feed_entries', FeedEntry.objects.filter(**recipes)),
+            ('favorites', Favorite.objects.filter(**recipes)),
+            ('shopping_carts', ShoppingCart.objects.filter(**recipes)),
+            ('ingredients', RecipeIngredient.objects.filter(**recipes)),
+            ('tags', Recipe.tags.through.objects.filter(**recipes)),
+            ('buckets', RecipeBucket.objects.filter(**recipes)),
+            ('signatures', RecipeSignature.objects.filter(**recipes)),
+            ('recipes', Recipe.objects.filter(author_id=user_id)),
+            ('follows', Follow.objects.filter(user_id=user_id)),
+            ('followers', Follow.objects.filter(author_id=user_id)),
+            ('feed', FeedEntry.objects.filter(user_id=user_id)),
+            ('own_favorites', Favorite.objects.filter(follower_id=user_id)),
+            (
+                'own_shopping_carts',
+                ShoppingCart.objects.filter(follower_id=user_id)
+            ),
+            (
+                'shopping_list',
+                ShoppingListItem.objects.filter(user_id=user_id)
+            ),
+        ]
+
+    @staticmethod
+    def delete_rows(queryset, ids):
+        """
+        Удаление строк порции. У избранного и корзин сбрасывается кеш
+        id рецептов подписчиков, списки покупок пересчитываются сразу.
+        С подпиской из ленты подписчика уходят рецепты автора, как при
+        отписке через API.
+        """
+        model = queryset.model
+        rows = model.objects.filter(pk__in=ids)
+        if model is Follow:
+            pairs = list(rows.values_list('user_id', 'author_id'))
+            rows.delete()
+            FeedEntry.objects.delete_for_follows(pairs)
+            return
+        if model not in (Favorite, ShoppingCart):
+            rows.delete()
+            return
+        user_ids = set(rows.values_list('follower_id', flat=True))
+        recipe_ids = set(rows.values_list('recipe_id', flat=True))
+        rows.delete()
+        model.objects.invalidate(user_ids)
+        if model is ShoppingCart:
+            ShoppingListItem.objects.refresh_for_recipes(user_ids, recipe_ids)
+
+    def run(self, time_limit, on_progress=None):
+        """
+        Удаление порциями, пока не истечёт time_limit секунд.
+        Возвращает True, если пользователь удалён полностью.
+        """
+        deadline = time.monotonic() + time_limit
+        for name, queryset in self.get_steps():
+            while True:
+                if time.monotonic() >= deadline:
+                    return False
+                ids = list(
+                    queryset.order_by('pk').values_list(
+                        'pk', flat=True
+                    )[:self.batch_size]
+                )
+                if not ids:
+                    break
+                with transaction.atomic():
+                    self.delete_rows(queryset, ids)
+                self.deleted[name] = self.deleted.get(name, 0) + len(ids)
+                if on_progress is not None:
+                    on_progress(self.deleted)
+        User.objects.filter(id=self.user_id).delete()
+        return True
@@ -0,0 +1,74 @@
+"""
+MinHash-подписи рецептов и разбиение их на полосы LSH.
+
+Рецепт описывается множеством признаков: его ингредиентами и тегами.
+Доля совпавших значений двух подписей оценивает коэффициент Жаккара
+этих множеств, а рецепты с совпадающей полосой подписи попадают
+в одну корзину, что позволяет искать кандидатов по индексу в базе.
+"""
+import random
+import zlib
+
+from .constants import SIMILAR_BANDS, SIMILAR_NUM_PERM
+
+# Простое число Мерсенна 2**61 - 1 для универсального хеширования.
+PRIME = (1 << 61) - 1
+# Подписи хранятся в базе, поэтому коэффициенты хеш-функций
+# не должны меняться между запусками.
+_random = random.Random(20231019)
+PERMUTATIONS = [
+    (_random.randrange(1, PRIME), _random.randrange(0, PRIME))
+    for _ in range(SIMILAR_NUM_PERM)
+]
+ROWS = SIMILAR_NUM_PERM // SIMILAR_BANDS
+
+
+def get_features(ingredient_ids, tag_ids):
+    """Признаки рецепта в виде устойчивых к перезапуску хешей."""
+    return {
+        zlib.crc32(f'i{ingredient_id}'.encode())
+        for ingredient_id in ingredient_ids
+    } | {
+        zlib.crc32(f't{tag_id}'.encode()) for tag_id in tag_ids
+    }
+
+
+def get_signature(features):
+    """
+    MinHash-подпись множества признаков. У рецепта без ингредиентов
+    и тегов подпись пустая: иначе подписи всех таких рецептов
+    совпали бы, и они считались бы одинаковыми.
+    """
+    if not features:
+        return []
+    return [
+        min((a * feature + b) % PRIME for feature in features)
+        for a, b in PERMUTATIONS
+    ]
+
+
+def get_buckets(signature):
+    """
+    Пары (номер полосы, хеш полосы) для индекса LSH, для пустой
+    подписи корзин нет.
+    """
+    if not signature:
+        return []
+    return [
+        (
+            band,
+            zlib.crc32(
+                ','.join(
+                    map(str, signature[band * ROWS:(band + 1) * ROWS])
+                ).encode()
+            )
+        )
+        for band in range(SIMILAR_BANDS)
+    ]
+
+
+def estimate_similarity(signature, other):
+    """Оценка коэффициента Жаккара по двум подписям."""
+    return sum(
+        value == other_value for value, other_value in zip(signature, other)
+    ) / SIMILAR_NUM_PERM
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файлы называются по хешу SHA-256 содержимого:
+    <каталог>/<2 символа хеша>/<хеш><расширение>. Одинаковое содержимое
+    получает одно имя, поэтому повторная загрузка не пишет на диск,
+    а лишь обновляет время изменения файла. Файл под таким именем
+    никогда не меняется, и его можно кешировать бессрочно.
+    """
+
+    @staticmethod
+    def get_hashed_name(name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        try:
+            # Свежее время изменения защищает файл от удаления
+            # неиспользуемых картинок, пока ссылка на него сохраняется.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            name = self._save(name, content)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        """
+        Запись во временный файл и переименование: параллельные загрузки
+        одного содержимого не мешают друг другу.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return name
@@ -0,0 +1,118 @@
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram.db_router import PRIMARY_DATABASE
+
+from .constants import TAG_REGISTRY_CHECK_SECONDS
+from .models import Tag
+
+VERSION_KEY = 'tag-registry-version'
+
+
+@dataclass(frozen=True)
+class TagState:
+    version: str
+    tags: dict
+    slug_ids: dict
+
+
+class TagRegistry:
+    """
+    Теги процесса в памяти: id -> тег и slug -> id.
+    Загружаются одним запросом при первом обращении. Сохранение или
+    удаление тега меняет версию в общем кеше, и остальные процессы
+    перечитывают теги при следующей проверке версии, не чаще
+    раза в TAG_REGISTRY_CHECK_SECONDS. Без общего кеша (SHARED_CACHE)
+    версией служат число тегов и последнее изменение в основной базе.
+    Экземпляры Tag общие для всех запросов и только читаются.
+    """
+
+    def __init__(self):
+        self.state = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_shared_version():
+        if not settings.SHARED_CACHE:
+            state = Tag.objects.using(PRIMARY_DATABASE).aggregate(
+                count=Count('id'), updated_at=Max('updated_at')
+            )
+            return f'{state["count"]}:{state["updated_at"]}'
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def load(self, version):
+        """
+        Теги читаются из основной базы: отстающая реплика сразу после
+        записи закешировала бы старые теги под новой версией.
+        """
+        tags = {tag.id: tag for tag in Tag.objects.using(PRIMARY_DATABASE)}
+        return TagState(
+            version=version,
+            tags=tags,
+            slug_ids={tag.slug: tag.id for tag in tags.values()}
+        )
+
+    def get_state(self):
+        state = self.state
+        now = time.monotonic()
+        if state is not None and now - self.checked_at < (
+            TAG_REGISTRY_CHECK_SECONDS
+        ):
+            return state
+        with self.lock:
+            version = self.get_shared_version()
+            if self.state is None or self.state.version != version:
+                self.state = self.load(version)
+            self.checked_at = now
+            return self.state
+
+    def get(self, tag_id):
+        return self.get_state().tags.get(tag_id)
+
+    def get_id_by_slug(self, slug):
+        return self.get_state().slug_ids.get(slug)
+
+    def get_slugs(self):
+        return list(self.get_state().slug_ids)
+
+    def get_ordered(self, tag_ids):
+        """Теги в порядке Tag.Meta.ordering."""
+        tags = self.get_state().tags
+        return sorted(
+            (tags[tag_id] for tag_id in tag_ids if tag_id in tags),
+            key=lambda tag: (tag.name, tag.id)
+        )
+
+    @property
+    def version(self):
+        return self.get_state().version
+
+    def invalidate(self):
+        """Новая версия после фиксации транзакции."""
+        def change_version():
+            cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+            self.state = None
+        transaction.on_commit(change_version)
+
+
+tag_registry = TagRegistry()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_registry(**kwargs):
+    tag_registry.invalidate()
@@ -0,0 +1,147 @@
+from django.utils import timezone
+
+from api.tasks import schedule_snapshots
+from recipes.constants import (
+    FEED_BACKFILL_RECIPES, FEED_FAN_OUT_BATCH, FEED_PROLIFIC_RECIPES,
+    USER_PURGE_BATCH_SIZE, USER_PURGE_TIME_LIMIT
+)
+from recipes.models import (
+    FeedEntry, Follow, ImageBlob, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, User
+)
+from recipes.purge import UserPurger
+from tasks.registry import report_progress, task
+
+
+@task(concurrency=2)
+def refresh_shopping_lists(ingredient_ids, user_ids=None, recipe_id=None):
+    """
+    Пересчёт списков покупок после изменения или удаления рецепта.
+    Для изменённого рецепта пользователи берутся из корзин в момент
+    выполнения, для удалённого передаются явно.
+    """
+    if recipe_id is not None:
+        ShoppingListItem.objects.refresh_for_recipe(recipe_id, ingredient_ids)
+    else:
+        ShoppingListItem.objects.refresh(user_ids, ingredient_ids)
+
+
+def delete_recipes(recipes):
+    """
+    Удаление рецептов с пересчётом списков покупок пользователей,
+    у которых они лежали в корзине.
+    """
+    recipe_ids = [recipe.id for recipe in recipes]
+    ingredient_ids = list(
+        RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', flat=True).distinct()
+    )
+    user_ids = list(
+        ShoppingCart.objects.filter(recipe_id__in=recipe_ids).values_list(
+            'follower_id', flat=True
+        ).distinct()
+    )
+    for recipe in recipes:
+        recipe.delete()
+    if user_ids:
+        refresh_shopping_lists.delay(
+            user_ids=user_ids, ingredient_ids=ingredient_ids
+        )
+
+
+def write_feed_entries(user_ids, recipe_ids):
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids for recipe_id in recipe_ids
+        ],
+        ignore_conflicts=True
+    )
+
+
+@task()
+def fan_out_recipe(recipe_id):
+    """
+    Рассылка нового рецепта в ленты подписчиков автора. Автор, у
+    которого рецептов больше FEED_PROLIFIC_RECIPES, помечается
+    is_prolific, и его рецепты дальше читаются при запросе ленты.
+    """
+    recipe = Recipe.objects.select_related('author').filter(
+        id=recipe_id
+    ).first()
+    if recipe is None or recipe.author.deleted_at is not None:
+        return
+    author = recipe.author
+    if (
+        not author.is_prolific
+        and author.recipes.count() >= FEED_PROLIFIC_RECIPES
+    ):
+        author.is_prolific = True
+        author.save(update_fields=['is_prolific'])
+    if author.is_prolific:
+        return
+    follower_ids = []
+    for user_id in Follow.objects.filter(author=author).values_list(
+        'user_id', flat=True
+    ).iterator(chunk_size=FEED_FAN_OUT_BATCH):
+        follower_ids.append(user_id)
+        if len(follower_ids) >= FEED_FAN_OUT_BATCH:
+            write_feed_entries(follower_ids, [recipe_id])
+            follower_ids = []
+    write_feed_entries(follower_ids, [recipe_id])
+
+
+@task()
+def backfill_feed(user_id, author_id):
+    """Последние рецепты автора в ленте нового подписчика."""
+    if not Follow.objects.filter(
+        user_id=user_id, author_id=author_id, author__is_prolific=False,
+        author__deleted_at__isnull=True
+    ).exists():
+        return
+    write_feed_entries(
+        [user_id],
+        Recipe.objects.filter(author_id=author_id).order_by(
+            '-publication_date'
+        ).values_list('id', flat=True)[:FEED_BACKFILL_RECIPES]
+    )
+
+
+@task()
+def delete_unused_images(names):
+    """Удаление файлов картинок, на которые не ссылается ни один рецепт."""
+    ImageBlob.objects.collect(names)
+
+
+@task(concurrency=2)
+def purge_user(user_id, deleted=None):
+    """
+    Удаление данных пользователя, отмеченного удалённым. Задача работает
+    не дольше USER_PURGE_TIME_LIMIT секунд и, если данные остались,
+    ставит своё продолжение с накопленными счётчиками.
+    """
+    if not User.objects.filter(
+        id=user_id, deleted_at__isnull=False
+    ).exists():
+        return
+    purger = UserPurger(user_id, USER_PURGE_BATCH_SIZE, deleted)
+    if not purger.run(
+        USER_PURGE_TIME_LIMIT, lambda deleted: report_progress(**deleted)
+    ):
+        purge_user.delay(user_id=user_id, deleted=purger.deleted)
+
+
+def delete_users(users):
+    """
+    Пользователи сразу отключаются и скрываются из API, а их данные
+    удаляет задача purge_user. Снимки перепубликуются без их рецептов.
+    """
+    user_ids = [user.id for user in users]
+    now = timezone.now()
+    User.objects.filter(id__in=user_ids).update(
+        is_active=False, deleted_at=now, updated_at=now
+    )
+    for user_id in user_ids:
+        purge_user.delay(user_id=user_id)
+    schedule_snapshots()
@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from tasks.models import Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'name', 'status', 'attempts', 'run_at', 'duration',
+        'finished_at'
+    ]
+    list_filter = ['status', 'name']
+    readonly_fields = [
+        'created_at', 'started_at', 'finished_at', 'duration', 'error',
+        'progress'
+    ]
+
+
+admin.site.register(Task, TaskAdmin)
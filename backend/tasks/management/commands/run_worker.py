@@ -0,0 +1,77 @@
+import signal
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from tasks.models import Task
+from tasks.registry import execute, registry
+
+
+class Command(BaseCommand):
+    help = 'Выполнять фоновые задачи из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=settings.TASKS_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, с.'
+        )
+
+    def stop(self, *args):
+        self.running = False
+
+    def prune(self, timeout):
+        """
+        Отметка упавшими задач, потерянных на последней попытке,
+        и удаление завершённых задач старше TASKS_RETENTION_DAYS.
+        """
+        failed = Task.objects.fail_abandoned(timeout)
+        if failed:
+            self.stdout.write(f'Потерянных задач: {failed}')
+        deleted = Task.objects.prune(
+            timezone.now() - timedelta(days=settings.TASKS_RETENTION_DAYS)
+        )
+        if deleted:
+            self.stdout.write(f'Удалено старых задач: {deleted}')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        limits = {name: spec.concurrency for name, spec in registry.items()}
+        timeout = timedelta(seconds=settings.TASKS_TIMEOUT)
+        pruned_at = 0
+        while self.running:
+            close_old_connections()
+            try:
+                if (
+                    time.monotonic() - pruned_at
+                    >= settings.TASKS_PRUNE_INTERVAL
+                ):
+                    self.prune(timeout)
+                    pruned_at = time.monotonic()
+                task = Task.objects.claim(limits, timeout)
+            except DatabaseError as error:
+                # База недоступна или ещё не мигрирована: воркер
+                # не завершается и повторяет опрос.
+                if options['once']:
+                    raise
+                self.stderr.write(f'Ошибка базы данных: {error}')
+                time.sleep(options['sleep'])
+                continue
+            if task is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            execute(task)
+            self.stdout.write(
+                f'{task} за {task.duration:.3f} с, попытка {task.attempts}'
+            )
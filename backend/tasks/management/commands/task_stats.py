@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Показать метрики фоновых задач.'
+
+    def handle(self, *args, **options):
+        columns = [
+            'pending', 'running', 'done', 'failed', 'retried',
+            'avg_duration', 'max_duration'
+        ]
+        self.stdout.write('\t'.join(['name'] + columns))
+        for row in Task.objects.stats():
+            values = [row['name']]
+            for column in columns:
+                value = row[column]
+                if isinstance(value, float):
+                    value = f'{value:.3f}'
+                values.append(str(value if value is not None else '-'))
+            self.stdout.write('\t'.join(values))
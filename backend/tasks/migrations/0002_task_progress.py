@@ -0,0 +1,18 @@
+# Generated by Django 4.2.5 on 2026-10-19 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Прогресс'),
+        ),
+    ]
@@ -0,0 +1,179 @@
+from datetime import timedelta
+
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+
+class TaskManager(models.Manager):
+
+    def lock_name(self, name):
+        """
+        Транзакционная advisory-блокировка имени задачи в PostgreSQL:
+        воркеры считают выполняемые задачи одного типа по очереди
+        и не превышают concurrency вместе.
+        """
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(hashtext(%s))', [f'task:{name}']
+            )
+
+    def claim(self, concurrency_limits, timeout):
+        """
+        Захват одной готовой к выполнению задачи. SKIP LOCKED позволяет
+        нескольким воркерам разбирать очередь, не блокируя друг друга.
+        Задачи, зависшие в работе дольше timeout, считаются потерянными
+        и выдаются снова, пока не исчерпаны попытки: задача, которая
+        роняет процесс воркера, не выдаётся бесконечно. Если выполняется
+        уже concurrency задач того же типа, берётся задача другого типа.
+        """
+        now = timezone.now()
+        saturated = set()
+        with transaction.atomic():
+            while True:
+                task = self.select_for_update(skip_locked=True).filter(
+                    models.Q(status=Task.PENDING, run_at__lte=now)
+                    | models.Q(
+                        status=Task.RUNNING, started_at__lt=now - timeout,
+                        attempts__lt=models.F('max_attempts')
+                    )
+                ).exclude(name__in=saturated).order_by('run_at', 'id').first()
+                if task is None:
+                    return None
+                limit = concurrency_limits.get(task.name)
+                if not limit:
+                    break
+                self.lock_name(task.name)
+                running = self.filter(
+                    name=task.name, status=Task.RUNNING,
+                    started_at__gte=now - timeout
+                ).count()
+                if running < limit:
+                    break
+                saturated.add(task.name)
+            task.status = Task.RUNNING
+            task.started_at = now
+            task.attempts += 1
+            task.save(update_fields=['status', 'started_at', 'attempts'])
+        return task
+
+    def fail_abandoned(self, timeout):
+        """
+        Отметка упавшими задач, зависших в работе дольше timeout
+        после последней попытки: воркер завершился, не дойдя
+        до обработки ошибки. Возвращает число таких задач.
+        """
+        now = timezone.now()
+        return self.filter(
+            status=Task.RUNNING, started_at__lt=now - timeout,
+            attempts__gte=models.F('max_attempts')
+        ).update(
+            status=Task.FAILED, finished_at=now,
+            error='Воркер завершился во время выполнения задачи.'
+        )
+
+    def prune(self, before, batch_size=1000):
+        """
+        Удаление выполненных и упавших задач, завершённых раньше before,
+        порциями по batch_size. Возвращает число удалённых задач.
+        """
+        deleted = 0
+        while True:
+            ids = list(
+                self.filter(
+                    status__in=[Task.DONE, Task.FAILED],
+                    finished_at__lt=before
+                ).order_by().values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                return deleted
+            deleted += self.filter(id__in=ids).delete()[0]
+
+    def stats(self):
+        """Метрики по каждому типу задач."""
+        return self.values('name').annotate(
+            pending=models.Count('id', filter=models.Q(status=Task.PENDING)),
+            running=models.Count('id', filter=models.Q(status=Task.RUNNING)),
+            done=models.Count('id', filter=models.Q(status=Task.DONE)),
+            failed=models.Count('id', filter=models.Q(status=Task.FAILED)),
+            retried=models.Count('id', filter=models.Q(attempts__gt=1)),
+            avg_duration=models.Avg('duration'),
+            max_duration=models.Max('duration'),
+        ).order_by('name')
+
+
+class Task(models.Model):
+    """Задача в очереди, которую выполняет воркер run_worker."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name='Задача')
+    payload = models.JSONField(default=dict, verbose_name='Аргументы')
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='Попыток'
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        default=3, verbose_name='Максимум попыток'
+    )
+    run_at = models.DateTimeField(
+        default=timezone.now, verbose_name='Запустить после'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True, verbose_name='Создана'
+    )
+    started_at = models.DateTimeField(null=True, verbose_name='Начата')
+    finished_at = models.DateTimeField(null=True, verbose_name='Завершена')
+    duration = models.FloatField(
+        null=True, verbose_name='Длительность, с'
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    progress = models.JSONField(
+        default=dict, blank=True, verbose_name='Прогресс'
+    )
+
+    objects = TaskManager()
+
+    class Meta:
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['run_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='task_pending_idx'
+            ),
+            models.Index(
+                fields=['name', 'started_at'],
+                condition=models.Q(status='running'),
+                name='task_running_idx'
+            ),
+            models.Index(
+                fields=['finished_at'],
+                condition=models.Q(status__in=['done', 'failed']),
+                name='task_finished_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.get_status_display()})'
+
+    def retry_at(self, retry_delay):
+        """Экспоненциальная задержка перед повторной попыткой."""
+        return timezone.now() + timedelta(
+            seconds=retry_delay * 2 ** (self.attempts - 1)
+        )
@@ -0,0 +1,94 @@
+import time
+import traceback
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils import timezone
+
+from tasks.models import Task
+
+registry = {}
+current_task = ContextVar('current_task', default=None)
+
+
+@dataclass
+class TaskSpec:
+    func: callable
+    max_attempts: int
+    concurrency: int
+    retry_delay: int
+
+
+def task(name=None, max_attempts=3, concurrency=None, retry_delay=10):
+    """
+    Регистрация функции как фоновой задачи. Аргументы передаются
+    только именованными и должны сериализоваться в JSON.
+    concurrency ограничивает число одновременно выполняемых задач
+    этого типа на всех воркерах.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        registry[task_name] = TaskSpec(
+            func, max_attempts, concurrency, retry_delay
+        )
+        func.delay = lambda **payload: enqueue(task_name, **payload)
+        func.task_name = task_name
+        return func
+    return decorator
+
+
+def enqueue(name, run_at=None, **payload):
+    """
+    Постановка задачи в очередь. Строка пишется в той же транзакции,
+    что и изменения, из-за которых задача появилась.
+    """
+    spec = registry[name]
+    if settings.TASKS_ALWAYS_EAGER:
+        spec.func(**payload)
+        return None
+    return Task.objects.create(
+        name=name, payload=payload, max_attempts=spec.max_attempts,
+        run_at=run_at or timezone.now()
+    )
+
+
+def execute(task):
+    """Выполнение захваченной задачи с учётом повторов."""
+    spec = registry.get(task.name)
+    start = time.perf_counter()
+    token = current_task.set(task)
+    try:
+        if spec is None:
+            raise LookupError(f'Задача {task.name} не зарегистрирована.')
+        spec.func(**task.payload)
+    except Exception:
+        task.error = traceback.format_exc()
+        if spec is not None and task.attempts < task.max_attempts:
+            task.status = Task.PENDING
+            task.run_at = task.retry_at(spec.retry_delay)
+        else:
+            task.status = Task.FAILED
+    else:
+        task.status = Task.DONE
+        task.error = ''
+    finally:
+        current_task.reset(token)
+    task.duration = time.perf_counter() - start
+    task.finished_at = timezone.now()
+    task.save(
+        update_fields=['status', 'run_at', 'error', 'duration', 'finished_at']
+    )
+    return task
+
+
+def report_progress(**progress):
+    """
+    Сохранение прогресса выполняемой задачи, который виден в админке.
+    Вне воркера (и при TASKS_ALWAYS_EAGER) ничего не делает.
+    """
+    task = current_task.get()
+    if task is None:
+        return
+    task.progress = progress
+    Task.objects.filter(id=task.id).update(progress=progress)